@@ -0,0 +1,92 @@
+"""
+Micro-benchmark for answer extraction.
+
+Times the precompiled AnswerExtractor against the previous lowercase-and-find implementation on
+synthetic email bodies from 1 KB to 1 MB, including long quoted reply chains. The per-message
+time for a reply should stay flat as the quoted history below it grows. Bodies where the question
+is missing or only appears at the very end still have to be read in full, so their cost grows
+with size for both implementations.
+
+Usage (from the project directory):
+    python benchmarks/bench_extract_answer.py [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from email_scanner import AnswerExtractor
+
+QUESTION = "Do you still need the use of this mobile phone?"
+SIZES_KB = [1, 10, 100, 1024]
+
+FILLER = ("Thanks for reaching out about the device inventory. Please let me know if you need anything "
+          "else from me, I am in the office most days this week.\n")
+QUOTED_MESSAGE = ("\n> From: Mobile Device Team <mobile@example.gov>\n> Sent: Monday, March 3, 2025 9:00 AM\n"
+                  "> Subject: RE: Mobile Phone Usage Query\n> \n> " + QUESTION + " Please reply Yes or No.\n> \n")
+
+
+def legacy_extract_answer(text_body, question):
+    """The extraction logic before AnswerExtractor, kept here as the comparison baseline."""
+    text_body_lower = text_body.lower()
+    question_index = text_body_lower.find(question.lower())
+    if question_index == -1:
+        return None
+    search_window_start = question_index + len(question)
+    text_after_question = text_body_lower[search_window_start:search_window_start + 100]
+    match_yes = re.search(r'\byes\b', text_after_question)
+    match_no = re.search(r'\bno\b', text_after_question)
+    if match_yes and match_no:
+        return "Yes" if match_yes.start() < match_no.start() else "No"
+    return "Yes" if match_yes else "No" if match_no else None
+
+
+def pad(text, size, unit):
+    """Repeats unit after text until the body is size bytes long."""
+    repeats = max(0, (size - len(text)) // len(unit) + 1)
+    return (text + unit * repeats)[:size]
+
+
+def make_bodies(size):
+    """Synthetic bodies of roughly `size` characters for each scenario."""
+    return {
+        # Inline answer at the top, followed by a long quoted reply chain
+        "reply_chain": pad(f"{QUESTION} No\n\nSent from my phone\n", size, QUOTED_MESSAGE),
+        # Answer in a short reply, long unrelated text below it
+        "answer_at_top": pad(f"Hello,\n{QUESTION}\nYes, I still use it daily.\n", size, FILLER),
+        # Question only appears at the very end, so the whole body must be scanned
+        "question_at_end": pad("", size - len(QUESTION) - 4, FILLER) + f"{QUESTION} no",
+        # Question missing entirely (e.g. an out-of-office reply)
+        "no_question": pad("I am out of the office until Monday.\n", size, FILLER),
+    }
+
+
+def time_per_call(func, body, repeat):
+    number = max(1, 20000 // max(1, len(body) // 1024))
+    best = min(timeit.repeat(lambda: func(body), number=number, repeat=repeat))
+    return best / number * 1e6  # microseconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions per case (best is reported)")
+    args = parser.parse_args()
+
+    extractor = AnswerExtractor([QUESTION])
+    legacy = lambda body: legacy_extract_answer(body, QUESTION)
+
+    print(f"{'scenario':<16} {'size':>8} {'legacy us/msg':>14} {'extractor us/msg':>17} {'speedup':>8}")
+    for size_kb in SIZES_KB:
+        for scenario, body in make_bodies(size_kb * 1024).items():
+            expected = legacy(body)
+            if extractor.extract(body) != expected:
+                raise SystemExit(f"Result mismatch for {scenario} at {size_kb} KB")
+            legacy_us = time_per_call(legacy, body, args.repeat)
+            extractor_us = time_per_call(extractor.extract, body, args.repeat)
+            print(f"{scenario:<16} {str(size_kb) + ' KB':>8} {legacy_us:>14.2f} {extractor_us:>17.2f} {legacy_us / extractor_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
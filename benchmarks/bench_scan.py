@@ -0,0 +1,265 @@
+"""
+End-to-end scan benchmark against the local Graph stand-in (mock_graph_server.py).
+
+Starts the mock server with a synthetic mailbox, then runs email_scanner.main() once per
+scenario (and per --repeat) in a fresh process and working directory, with GRAPH_BASE_URL
+pointing at the server and a pre-seeded access token so no sign-in happens. Reports for each run:
+
+    msgs/s        matching messages in the mailbox divided by the wall time of main()
+    calls/msg     HTTP calls received by the server per matching message ($batch items in brackets)
+    peak RSS      maximum resident set size of the scanner process
+    p50/p99 ms    per-message latency, from the moment the message's page was received to the
+                  moment its answer was extracted
+    records       rows in the exported CSV; runs that export different CSVs are flagged
+
+The folder scenario scans only the mailbox's Inbox, which every synthetic message is in, so emails
+are moved out of the folder being listed. The rerun scenario first scans the replies received
+before RERUN_FIRST_BEFORE in the same directory (untimed), then times a second run that finds
+that run's records in the store and its emails in the processed folder. Both must export the same
+CSV as a first run over the whole mailbox.
+
+The multi_survey scenario scans for every campaign in the mailbox (see --extra-surveys) in one pass
+through a SURVEYS_FILE; its records are those of the first survey, so they still compare with the
+other scenarios.
+
+Settings from a .env file in the project directory still apply unless a scenario or --env
+overrides them.
+
+Usage (from the project directory):
+    python benchmarks/bench_scan.py [--messages 5000] [--latency-ms 20] [--throttle-rate 0.01]
+                                    [--scenario pipeline --scenario two_phase] [--extra-surveys 2] [--env SCAN_WORKERS=8]
+                                    [--repeat N] [--json results.json]
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from mock_graph_server import DEFAULT_QUESTION, DEFAULT_SUBJECT, add_server_arguments, compile_filter, server_from_args, write_export
+
+BENCH_MAILBOX = "survey.bench@example.gov"
+BENCH_CSV_FILENAME = "bench_results.csv"
+BASE_ENV = {
+    "EMAIL_ADDRESS": BENCH_MAILBOX,
+    "TENANT_ID": "bench-tenant",
+    "CLIENT_ID": "bench-client",
+    "CLIENT_SECRET": "bench-secret",
+    "TARGET_SUBJECT": DEFAULT_SUBJECT,
+    "SEARCH_QUESTION": DEFAULT_QUESTION,
+    "OUTPUT_CSV_FILE": BENCH_CSV_FILENAME,
+    "PROCESSED_FOLDER_NAME": "ProcessedSurveyEmails",
+}
+SCENARIOS = {
+    "serial": {"SCAN_WORKERS": "0"},
+    "pipeline": {"SCAN_WORKERS": "4"},
+    "two_phase": {"TWO_PHASE_SCAN": "true"},
+    "search": {"SERVER_SEARCH": "true"},
+    # Read from a mailbox export written from the same synthetic mailbox instead of the server
+    "offline_mbox": {"BENCH_EXPORT": "export.mbox"},
+    "offline_eml": {"BENCH_EXPORT": "export_eml/"},
+    # Moves take emails out of the folder being listed
+    "folder": {"SCAN_TARGETS": f"{BENCH_MAILBOX}:Inbox"},
+    # A second run against a non-empty store, with the processed folder left out of the listing
+    "rerun": {"BENCH_FIRST_RUN": "RECEIVED_BEFORE", "EXCLUDE_PROCESSED_FOLDER": "true"},
+    # All campaigns of the mailbox in one pass, through a rules file written from the synthetic mailbox
+    "multi_survey": {"BENCH_SURVEYS": "surveys.json"},
+}
+RERUN_FIRST_BEFORE = "2025-04-15T00:00:00Z" # About halfway through the synthetic mailbox's six months
+
+
+# --- Scanner process ---
+def seed_token_cache(client_id, tenant_id):
+    """
+    Writes an unexpired access token to o365_token.txt in the working directory, in the MSAL
+    cache format the O365 file token backend reads, so Account.is_authenticated is True.
+    """
+    now = int(time.time())
+    token = {
+        "credential_type": "AccessToken", "secret": "bench-access-token", "home_account_id": "",
+        "environment": "login.microsoftonline.com", "client_id": client_id, "realm": tenant_id,
+        "target": "https://graph.microsoft.com/.default", "token_type": "Bearer",
+        "cached_at": str(now), "expires_on": str(now + 3600), "extended_expires_on": str(now + 3600),
+    }
+    cache = {"AccessToken": {"bench-access-token": token}, "RefreshToken": {}, "IdToken": {}, "Account": {}, "AppMetadata": {}}
+    with open("o365_token.txt", "w", encoding="utf-8") as token_file:
+        json.dump(cache, token_file)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_scanner():
+    """Runs main() in this process (already set up by the parent) and prints the measurements as JSON."""
+    seed_token_cache(os.environ["CLIENT_ID"], os.environ["TENANT_ID"])
+    sys.path.insert(0, PROJECT_DIR)
+    import email_scanner
+
+    # Per-message latency: pages are timestamped as the listing yields them (on the prefetch
+    # thread when the pipeline is on), messages when their answer has been extracted
+    page_received_at = {}
+    latencies = []
+
+    def timed_pages(iter_pages):
+        def wrapper(*args, **kwargs):
+            for page in iter_pages(*args, **kwargs):
+                received_at = time.perf_counter()
+                for message in page[0]:
+                    page_received_at.setdefault(getattr(message, "object_id", None) or message.get("id"), received_at)
+                yield page
+        return wrapper
+
+    parse_message = email_scanner.parse_message
+
+    def timed_parse_message(msg):
+        parsed = parse_message(msg)
+        latencies.append(time.perf_counter() - page_received_at.get(msg.object_id, started))
+        return parsed
+
+    email_scanner.iter_message_pages = timed_pages(email_scanner.iter_message_pages)
+    email_scanner.iter_two_phase_pages = timed_pages(email_scanner.iter_two_phase_pages)
+    email_scanner.parse_message = timed_parse_message
+
+    started = time.perf_counter()
+    email_scanner.main(["--from-export", os.environ["BENCH_EXPORT"]] if os.environ.get("BENCH_EXPORT") else [])
+    elapsed = time.perf_counter() - started
+
+    csv_path = email_scanner.SURVEY_RULES.surveys[0].csv_path
+    records, digest = 0, None
+    if os.path.exists(csv_path):
+        with open(csv_path, "rb") as csv_file:
+            digest = hashlib.sha1(csv_file.read()).hexdigest()
+        with open(csv_path, newline="", encoding="utf-8") as csv_file:
+            records = sum(1 for _ in csv.DictReader(csv_file))
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss_kb = peak_rss_kb // 1024 if sys.platform == "darwin" else peak_rss_kb
+    except ImportError:
+        peak_rss_kb = None
+    print(json.dumps({
+        "elapsed_s": elapsed, "parsed": len(latencies), "peak_rss_kb": peak_rss_kb,
+        "p50_ms": (percentile(latencies, 0.50) or 0) * 1000, "p99_ms": (percentile(latencies, 0.99) or 0) * 1000,
+        "records": records, "csv_sha1": digest,
+    }))
+
+
+# --- Benchmark driver ---
+def write_survey_rules(mailbox, path):
+    """Writes a SURVEYS_FILE with one survey per campaign of the mailbox; the first writes the usual CSV."""
+    surveys = [{
+        "name": f"survey{rank}",
+        "subject": subject,
+        "question": question,
+        "output_csv": BENCH_CSV_FILENAME if rank == 0 else f"survey{rank}.csv",
+        "processed_folder": BASE_ENV["PROCESSED_FOLDER_NAME"] if rank == 0 else f"ProcessedSurvey{rank}",
+    } for rank, (subject, question) in enumerate(mailbox.surveys)]
+    with open(path, "w", encoding="utf-8") as rules_file:
+        json.dump({"surveys": surveys}, rules_file, indent=2)
+
+
+def run_scanner_process(name, work_dir, env):
+    """Runs the scanner once in work_dir and returns its measurements."""
+    with open(os.path.join(work_dir, "scanner.log"), "w", encoding="utf-8") as scanner_log:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-scanner"], cwd=work_dir,
+                                   env=env, stdout=subprocess.PIPE, stderr=scanner_log, text=True)
+    if completed.returncode != 0 or not completed.stdout.strip():
+        with open(os.path.join(work_dir, "scanner.log"), encoding="utf-8") as scanner_log:
+            raise SystemExit(f"Scenario {name} failed (exit {completed.returncode}):\n{scanner_log.read()[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_scenario(server, name, env_overrides, matching_messages):
+    server.reset()
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as work_dir:
+        env = dict(os.environ, **BASE_ENV, GRAPH_BASE_URL=server.base_url)
+        env.update(SCENARIOS[name])
+        env.update(env_overrides)
+        if env.get("BENCH_EXPORT"):
+            env["BENCH_EXPORT"] = os.path.join(work_dir, env["BENCH_EXPORT"])
+            write_export(server.get_mailbox(env.get("EMAIL_ADDRESS", BENCH_MAILBOX)), env["BENCH_EXPORT"])
+        if env.get("BENCH_SURVEYS"):
+            env["SURVEYS_FILE"] = os.path.join(work_dir, env["BENCH_SURVEYS"])
+            write_survey_rules(server.get_mailbox(env.get("EMAIL_ADDRESS", BENCH_MAILBOX)), env["SURVEYS_FILE"])
+        if env.get("BENCH_FIRST_RUN"):
+            # Untimed first run over the older replies; the timed run finds its store, sync state and moves
+            run_scanner_process(name, work_dir, dict(env, **{env.pop("BENCH_FIRST_RUN"): RERUN_FIRST_BEFORE}))
+            server.reset_counters()
+        result = run_scanner_process(name, work_dir, env)
+
+    calls = {route: count for route, count in server.counters.items()}
+    http_calls = sum(count for route, count in calls.items() if not route.startswith("batch "))
+    batch_items = sum(count for route, count in calls.items() if route.startswith("batch "))
+    result.update({
+        "scenario": name,
+        "messages": matching_messages,
+        "msgs_per_s": matching_messages / result["elapsed_s"] if result["elapsed_s"] else None,
+        "http_calls": http_calls,
+        "batch_items": batch_items,
+        "calls_per_msg": http_calls / matching_messages if matching_messages else None,
+        "batch_items_per_msg": batch_items / matching_messages if matching_messages else None,
+        "calls_by_route": calls,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_server_arguments(parser)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable); all scenarios by default")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra scanner setting applied to every scenario (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario")
+    parser.add_argument("--json", help="also write all results to this file")
+    parser.add_argument("--run-scanner", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scanner:
+        run_scanner()
+        return
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    server = server_from_args(args)
+    server.serve_in_background()
+    subject_filter = compile_filter(f"contains(subject, '{env_overrides.get('TARGET_SUBJECT', DEFAULT_SUBJECT)}')")
+    # With SCAN_TARGETS the scanner reads several mailboxes (every synthetic message is in the Inbox)
+    mailboxes = dict.fromkeys(entry.partition(":")[0].strip() for entry in env_overrides.get("SCAN_TARGETS", BENCH_MAILBOX).split("|"))
+    matching_messages = sum(1 for address in mailboxes for message in server.get_mailbox(address).messages if subject_filter(message))
+    print(f"Mock Graph server at {server.base_url}: {len(mailboxes)} x {args.messages} messages, {matching_messages} matching the subject, "
+          f"latency {args.latency_ms} ms, throttle rate {args.throttle_rate}")
+
+    results = []
+    print(f"{'scenario':<12} {'time s':>8} {'msgs/s':>9} {'calls/msg':>16} {'peak RSS MB':>12} {'p50 ms':>9} {'p99 ms':>9} {'records':>8}")
+    for name in args.scenario or list(SCENARIOS):
+        for _ in range(args.repeat):
+            result = run_scenario(server, name, env_overrides, matching_messages)
+            results.append(result)
+            peak_rss = f"{result['peak_rss_kb'] / 1024:.1f}" if result["peak_rss_kb"] else "n/a"
+            calls_per_msg = f"{result['calls_per_msg']:.3f} [{result['batch_items_per_msg']:.2f}]"
+            print(f"{name:<12} {result['elapsed_s']:>8.2f} {result['msgs_per_s']:>9.1f} {calls_per_msg:>16} {peak_rss:>12} "
+                  f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['records']:>8}")
+    server.shutdown()
+    server.server_close()
+
+    if len({result["csv_sha1"] for result in results}) > 1:
+        print("WARNING: runs exported different CSVs; compare the scenarios' records.")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+"""
+Local stand-in for the Microsoft Graph mail endpoints used by email_scanner.py.
+
+Serves synthetic mailboxes over plain HTTP so the scanner can be run and benchmarked without a
+tenant. Point the scanner at it with GRAPH_BASE_URL (e.g. "http://127.0.0.1:8765/"). Covered:
+
+    GET  /v1.0/users/{mailbox}/messages             $filter or $search, $select, $top, $orderby, $skip, @odata.nextLink
+    GET  /v1.0/users/{mailbox}/messages/{id}        $select
+    POST /v1.0/users/{mailbox}/messages/{id}/move
+    GET  /v1.0/users/{mailbox}/mailFolders          $filter=displayName eq '...'
+    POST /v1.0/users/{mailbox}/mailFolders
+    GET  /v1.0/users/{mailbox}/mailFolders/{id}/childFolders
+    GET  /v1.0/users/{mailbox}/mailFolders/{id}/messages      same options as /messages
+    POST /v1.0/$batch                               up to 20 of the requests above
+
+$filter understands contains(field, '...') and eq/ne/ge/gt/le/lt comparisons joined by and/or with
+parentheses, which is what the scanner sends. $search understands KQL restrictions on subject, body, from and
+received (prop:"phrase", received>=2025-01-31) joined by AND/OR with parentheses, and like Graph
+refuses to combine $search with $filter or $orderby and returns at most 1,000 search results, the newest. Each mailbox is generated on first use from the mailbox address and
+the seed, so repeated runs see identical data. Latency and 429 responses (with Retry-After) can
+be injected, both for whole HTTP calls and for individual $batch items.
+
+The same synthetic mailbox can also be written to disk as a mailbox export (an mbox file or a
+directory of .eml files) for email_scanner.py --from-export.
+
+Usage (from the project directory):
+    python benchmarks/mock_graph_server.py [--port 8765] [--messages 5000] [--latency-ms 20] [--throttle-rate 0.01]
+    python benchmarks/mock_graph_server.py --write-export replies.mbox [--mailbox survey@example.gov] [--messages 100000]
+"""
+import argparse
+import json
+import mailbox as mailbox_formats
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime, formataddr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+DEFAULT_SUBJECT = "Mobile Phone Usage Query"
+DEFAULT_QUESTION = "Do you still need the use of this mobile phone?"
+MAX_TOP = 999
+MAX_BATCH = 20
+MAX_SEARCH_RESULTS = 1000 # Graph returns at most this many messages for a $search, newest first
+INBOX_ID = "inbox"
+
+FILLER = ("Thanks for reaching out about the device inventory. Please let me know if you need anything "
+          "else from me, I am in the office most days this week.\n")
+# Further campaigns mixed into the mailbox with --extra-surveys, for the multi-survey scan
+EXTRA_SURVEYS = [
+    ("Mobile Hotspot Need Survey", "Do you still need your mobile hotspot?"),
+    ("Laptop Return Confirmation", "Have you returned your old laptop?"),
+    ("Tablet Usage Query", "Do you still use your tablet?"),
+]
+REPLIES = {
+    "Yes": ["Yes", "yes, I still use it daily", "YES - please keep it active"],
+    "No": ["No", "no, it can be collected", "No longer needed, thanks"],
+}
+
+
+class SyntheticMailbox:
+    """
+    A generated mailbox: survey replies from a pool of senders (several replies per sender, so
+    newer answers replace older ones), unrelated mail that the subject filter must skip, and
+    replies that never answer the question. Bodies carry the original survey email as quoted
+    history, padded to about body_chars characters. With extra_surveys, replies to that many of
+    EXTRA_SURVEYS are mixed in, each reply going to one campaign.
+    """
+    def __init__(self, address, message_count=2000, replies_per_sender=3, noise_ratio=0.1,
+                 unanswered_ratio=0.1, body_chars=4096, subject=DEFAULT_SUBJECT, question=DEFAULT_QUESTION,
+                 extra_surveys=0, seed=0):
+        rng = random.Random(f"{seed}:{address}")
+        self.address = address
+        self.surveys = [(subject, question)] + EXTRA_SURVEYS[:extra_surveys]
+        self.folders = {INBOX_ID: {"id": INBOX_ID, "displayName": "Inbox", "parentFolderId": None}}
+        self.messages = []
+        sender_count = max(1, message_count // max(1, replies_per_sender))
+        newest = datetime(2025, 6, 30, tzinfo=timezone.utc)
+        for index in range(message_count):
+            # Only draws a campaign when there is a choice, so the single-survey mailbox stays the same
+            subject, question = rng.choice(self.surveys) if len(self.surveys) > 1 else self.surveys[0]
+            quoted = (f"\n> From: Mobile Device Team <{address}>\n> Subject: {subject}\n> \n"
+                      f"> {question} Please reply Yes or No.\n> \n")
+            sender = rng.randrange(sender_count)
+            received = newest - timedelta(seconds=rng.randrange(180 * 24 * 3600))
+            history = quoted
+            if rng.random() < noise_ratio:
+                message_subject, reply = "Team lunch on Friday", "See you there."
+            elif rng.random() < unanswered_ratio:
+                # Automatic replies do not quote the survey email
+                message_subject, reply, history = f"RE: {subject}", "I am out of the office until Monday.", ""
+            else:
+                message_subject = f"RE: {subject}"
+                reply = f"{question} {rng.choice(REPLIES[rng.choice(['Yes', 'No'])])}"
+            body = reply + "\n\n" + history
+            body += (FILLER * (max(0, body_chars - len(body)) // len(FILLER) + 1))[:max(0, body_chars - len(body))]
+            self.messages.append({
+                "id": f"AAMk{index:08d}",
+                "subject": message_subject,
+                "from": {"emailAddress": {"name": f"User {sender}", "address": f"user{sender}@example.gov"}},
+                "receivedDateTime": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "bodyPreview": body[:255],
+                "body": {"contentType": "text", "content": body},
+                "uniqueBody": {"contentType": "text", "content": reply},
+                "parentFolderId": INBOX_ID,
+            })
+        # Graph lists messages newest first unless told otherwise
+        self.messages.sort(key=lambda message: message["receivedDateTime"], reverse=True)
+        self.by_id = {message["id"]: message for message in self.messages}
+
+
+class GraphError(Exception):
+    def __init__(self, status, code, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.headers = headers or {}
+
+
+_FILTER_TOKEN = re.compile(r"\s*(?:(\()|(\))|(and|or)\s|contains\((\w+),\s*'((?:[^']|'')*)'\)|(\w+)\s+(eq|ne|ge|gt|le|lt)\s+('(?:[^']|'')*'|[^\s)]+))")
+_COMPARISONS = {
+    "eq": lambda a, b: a == b, "ne": lambda a, b: a != b,
+    "ge": lambda a, b: a >= b, "gt": lambda a, b: a > b,
+    "le": lambda a, b: a <= b, "lt": lambda a, b: a < b,
+}
+
+
+def compile_filter(odata_filter):
+    """
+    Turns the subset of OData $filter syntax used by the scanner into a predicate on a resource
+    dict: contains() and comparisons joined by "and"/"or" ("and" binding tighter), with
+    parentheses. Timestamps are compared as strings, which works for the UTC "...Z" form Graph uses.
+    """
+    odata_filter = (odata_filter or "").strip()
+    tokens = []
+    position = 0
+    while odata_filter[position:].strip():
+        match = _FILTER_TOKEN.match(odata_filter, position)
+        if not match:
+            raise GraphError(400, "BadRequest", f"Unsupported filter: {odata_filter[position:]}")
+        position = match.end()
+        tokens.append(match.groups())
+
+    def test(token):
+        if token[3]:
+            field, needle = token[3], token[4].replace("''", "'").lower()
+            return lambda resource: needle in str(resource.get(field) or "").lower()
+        field, compare, value = token[5], _COMPARISONS[token[6]], token[7]
+        value = value[1:-1].replace("''", "'") if value.startswith("'") else value
+        return lambda resource: compare(str(resource.get(field) or ""), value)
+
+    def parse_or(index):
+        tests = []
+        while True:
+            tests_and, index = parse_and(index)
+            tests.append(tests_and)
+            if index < len(tokens) and tokens[index][2] == "or":
+                index += 1
+            else:
+                return (lambda resource: any(test(resource) for test in tests)), index
+
+    def parse_and(index):
+        tests = []
+        while True:
+            if index >= len(tokens) or tokens[index][1] or tokens[index][2]:
+                raise GraphError(400, "BadRequest", f"Unsupported filter: {odata_filter}")
+            if tokens[index][0]:
+                group, index = parse_or(index + 1)
+                if index >= len(tokens) or not tokens[index][1]:
+                    raise GraphError(400, "BadRequest", "Unbalanced parentheses in filter.")
+                tests.append(group)
+            else:
+                tests.append(test(tokens[index]))
+            index += 1
+            if index < len(tokens) and tokens[index][2] == "and":
+                index += 1
+            else:
+                return (lambda resource: all(test(resource) for test in tests)), index
+
+    if not tokens:
+        return lambda resource: True
+    predicate, index = parse_or(0)
+    if index != len(tokens):
+        raise GraphError(400, "BadRequest", f"Unsupported filter: {odata_filter}")
+    return predicate
+
+
+_KQL_TOKEN = re.compile(r'\s*(?:(\()|(\))|(AND|OR)\b|(\w+)(:|>=|<=|>|<)(?:"([^"]*)"|([^\s()]+)))')
+_KQL_FIELDS = {
+    "subject": lambda message: message.get("subject"),
+    "body": lambda message: (message.get("body") or {}).get("content"),
+    "from": lambda message: ((message.get("from") or {}).get("emailAddress") or {}).get("address"),
+    "received": lambda message: message.get("receivedDateTime"),
+}
+
+
+def _kql_words(text):
+    return " " + " ".join(re.findall(r"\w+", str(text or "").lower())) + " "
+
+
+def compile_search(search):
+    """
+    Turns the subset of KQL used by the scanner's $search into a predicate on a message dict.
+    Phrases match whole words in order, ignoring case and punctuation; received compares dates.
+    """
+    search = search.strip()
+    if search.startswith('"') and search.endswith('"'):
+        search = search[1:-1].replace('\\"', '"') # Phrases inside the quoted value arrive as \"...\"
+    tokens = []
+    position = 0
+    while search[position:].strip():
+        match = _KQL_TOKEN.match(search, position)
+        if not match:
+            raise GraphError(400, "BadRequest", f"Unsupported search: {search[position:]}")
+        position = match.end()
+        tokens.append(match.groups())
+
+    def restriction(field, operator, value):
+        if field not in _KQL_FIELDS:
+            raise GraphError(400, "BadRequest", f"Unsupported search property: {field}")
+        get = _KQL_FIELDS[field]
+        if operator == ":":
+            phrase = _kql_words(value)
+            return lambda message: phrase in _kql_words(get(message))
+        compare = _COMPARISONS[{">=": "ge", "<=": "le", ">": "gt", "<": "lt"}[operator]]
+        return lambda message: compare(str(get(message) or "")[:len(value)], value)
+
+    def parse_or(index):
+        test, index = parse_and(index)
+        tests = [test]
+        while index < len(tokens) and tokens[index][2] == "OR":
+            test, index = parse_and(index + 1)
+            tests.append(test)
+        return (lambda message: any(test(message) for test in tests)), index
+
+    def parse_and(index):
+        tests = []
+        while index < len(tokens) and tokens[index][1] is None and tokens[index][2] != "OR":
+            if tokens[index][2] == "AND":
+                index += 1
+                continue
+            open_paren, _, _, field, operator, phrase, word = tokens[index]
+            if open_paren:
+                test, index = parse_or(index + 1)
+                if index >= len(tokens) or not tokens[index][1]:
+                    raise GraphError(400, "BadRequest", "Unbalanced parentheses in search.")
+                index += 1
+            else:
+                test, index = restriction(field, operator, phrase if phrase is not None else word), index + 1
+            tests.append(test)
+        return (lambda message: all(test(message) for test in tests)), index
+
+    predicate, index = parse_or(0)
+    if index != len(tokens):
+        raise GraphError(400, "BadRequest", "Unbalanced parentheses in search.")
+    return predicate
+
+
+def select_fields(resource, select):
+    if not select:
+        return dict(resource)
+    fields = {"id"} | {field.strip() for field in select.split(",")}
+    return {key: value for key, value in resource.items() if key in fields}
+
+
+class MockGraphServer(ThreadingHTTPServer):
+    """
+    HTTP server holding the synthetic mailboxes and the injected faults, plus request counters
+    keyed by route (batch items are counted separately as "batch <route>").
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency_ms=0, throttle_rate=0.0, retry_after=1, seed=0, **mailbox_options):
+        super().__init__(address, GraphRequestHandler)
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.mailbox_options = mailbox_options
+        self.mailboxes = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def reset(self):
+        """Drops all mailboxes (they are regenerated on next use) and the counters."""
+        with self.lock:
+            self.mailboxes.clear()
+            self.counters.clear()
+            self.rng = random.Random(self.seed)
+
+    def reset_counters(self):
+        """Clears the counters but keeps the mailboxes, with the moves made so far."""
+        with self.lock:
+            self.counters.clear()
+
+    def get_mailbox(self, address):
+        with self.lock:
+            mailbox = self.mailboxes.get(address.lower())
+            if mailbox is None:
+                mailbox = self.mailboxes[address.lower()] = SyntheticMailbox(address, seed=self.seed, **self.mailbox_options)
+            return mailbox
+
+    def count(self, route):
+        with self.lock:
+            self.counters[route] += 1
+
+    def throttled(self):
+        if not self.throttle_rate:
+            return False
+        with self.lock:
+            return self.rng.random() < self.throttle_rate
+
+    def serve_in_background(self):
+        """Starts serving on a daemon thread and returns it."""
+        thread = threading.Thread(target=self.serve_forever, name="mock-graph", daemon=True)
+        thread.start()
+        return thread
+
+    # --- Request handling (shared by plain and $batch requests) ---
+    def dispatch(self, method, path, query, body):
+        """Handles one Graph request. Returns (status, payload, headers) or raises GraphError."""
+        parts = [part for part in path.split("/") if part]
+        if len(parts) < 4 or parts[0] != "v1.0" or parts[1] != "users":
+            raise GraphError(404, "ResourceNotFound", f"Unsupported path: {path}")
+        mailbox = self.get_mailbox(parts[2])
+        resource = parts[3:]
+        if resource == ["messages"] and method == "GET":
+            return self.list_messages(mailbox, mailbox.messages, path, query)
+        if len(resource) == 3 and resource[0] == "mailFolders" and resource[1] in mailbox.folders and method == "GET":
+            if resource[2] == "messages":
+                in_folder = [message for message in mailbox.messages if message["parentFolderId"] == resource[1]]
+                return self.list_messages(mailbox, in_folder, path, query)
+            if resource[2] == "childFolders":
+                return self.list_folders(mailbox, resource[1], query)
+        if len(resource) == 2 and resource[0] == "messages" and method == "GET":
+            message = mailbox.by_id.get(resource[1])
+            if message is None:
+                raise GraphError(404, "ErrorItemNotFound", "The specified object was not found in the store.")
+            return 200, select_fields(message, query.get("$select")), {}
+        if len(resource) == 3 and resource[0] == "messages" and resource[2] == "move" and method == "POST":
+            message = mailbox.by_id.get(resource[1])
+            if message is None:
+                raise GraphError(404, "ErrorItemNotFound", "The specified object was not found in the store.")
+            destination = (body or {}).get("destinationId")
+            if destination not in mailbox.folders:
+                raise GraphError(400, "ErrorInvalidIdMalformed", "Id is malformed.")
+            message["parentFolderId"] = destination
+            return 201, select_fields(message, "id,parentFolderId"), {}
+        if resource == ["mailFolders"] and method == "GET":
+            return self.list_folders(mailbox, None, query)
+        if resource == ["mailFolders"] and method == "POST":
+            name = (body or {}).get("displayName")
+            if not name:
+                raise GraphError(400, "ErrorInvalidRequest", "displayName is required.")
+            folder = {"id": f"folder-{len(mailbox.folders)}", "displayName": name, "parentFolderId": None}
+            mailbox.folders[folder["id"]] = folder
+            return 201, folder, {}
+        raise GraphError(405, "MethodNotAllowed", f"Unsupported request: {method} {path}")
+
+    def list_folders(self, mailbox, parent_id, query):
+        matches = [folder for folder in mailbox.folders.values()
+                   if folder["parentFolderId"] == parent_id and compile_filter(query.get("$filter"))(folder)]
+        return 200, {"value": matches[:int(query.get("$top") or MAX_TOP)]}, {}
+
+    def list_messages(self, mailbox, messages, path, query):
+        if "$search" in query:
+            if "$filter" in query or "$orderby" in query:
+                raise GraphError(400, "ErrorInvalidUrlQuery", "$search cannot be combined with $filter or $orderby.")
+            matches = [message for message in messages if compile_search(query["$search"])(message)][:MAX_SEARCH_RESULTS]
+        else:
+            matches = [message for message in messages if compile_filter(query.get("$filter"))(message)]
+        orderby = (query.get("$orderby") or "").split()
+        if orderby:
+            matches.sort(key=lambda message: str(message.get(orderby[0]) or ""), reverse=orderby[1:] == ["desc"])
+        top = min(int(query.get("$top") or 10), MAX_TOP)
+        skip = int(query.get("$skip") or 0)
+        page = matches[skip:skip + top]
+        payload = {"value": [select_fields(message, query.get("$select")) for message in page]}
+        if skip + top < len(matches):
+            next_query = dict(query, **{"$top": str(top), "$skip": str(skip + top)})
+            payload["@odata.nextLink"] = f"{self.base_url.rstrip('/')}{path}?{urlencode(next_query, quote_via=quote, safe='$,')}"
+        return 200, payload, {}
+
+    def run_batch(self, body):
+        requests = (body or {}).get("requests") or []
+        if len(requests) > MAX_BATCH:
+            raise GraphError(400, "BadRequest", f"A batch may hold at most {MAX_BATCH} requests.")
+        responses = []
+        for request in requests:
+            split_url = urlsplit(request.get("url", ""))
+            method = request.get("method", "GET").upper()
+            route = route_name(method, split_url.path)
+            self.count(f"batch {route}")
+            if self.throttled():
+                status, payload, headers = throttle_response(self.retry_after)
+            else:
+                try:
+                    status, payload, headers = self.dispatch(method, "/v1.0" + split_url.path,
+                                                             dict(parse_qsl(split_url.query)), request.get("body"))
+                except GraphError as error:
+                    status, payload, headers = error_response(error)
+            responses.append({"id": request.get("id"), "status": status, "headers": headers, "body": payload})
+        return 200, {"responses": responses}, {}
+
+
+def route_name(method, path):
+    """Groups request paths by endpoint, e.g. "POST messages/{id}/move"."""
+    parts = [part for part in path.split("/") if part]
+    if parts[:1] == ["v1.0"]:
+        parts = parts[1:]
+    if parts[:1] == ["users"]:
+        parts = parts[2:]
+    if len(parts) > 1 and parts[0] in ("messages", "mailFolders"):
+        parts[1] = "{id}"
+    return f"{method} {'/'.join(parts)}"
+
+
+def throttle_response(retry_after):
+    error = GraphError(429, "TooManyRequests", "Application is over its MailboxConcurrency limit.",
+                       {"Retry-After": str(retry_after)})
+    return error_response(error)
+
+
+def error_response(error):
+    return error.status, {"error": {"code": error.code, "message": str(error)}}, error.headers
+
+
+class GraphRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_graph_request("GET")
+
+    def do_POST(self):
+        self.handle_graph_request("POST")
+
+    def handle_graph_request(self, method):
+        server = self.server
+        split_url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        route = "POST $batch" if split_url.path.rstrip("/").endswith("$batch") else route_name(method, split_url.path)
+        server.count(route)
+        if server.latency_ms:
+            time.sleep(server.latency_ms / 1000)
+        if server.throttled():
+            status, payload, headers = throttle_response(server.retry_after)
+        else:
+            try:
+                body = json.loads(raw_body) if raw_body else None
+                if route == "POST $batch":
+                    status, payload, headers = server.run_batch(body)
+                else:
+                    status, payload, headers = server.dispatch(method, split_url.path, dict(parse_qsl(split_url.query)), body)
+            except GraphError as error:
+                status, payload, headers = error_response(error)
+            except Exception as error:
+                status, payload, headers = error_response(GraphError(500, "InternalServerError", str(error)))
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate the benchmark output
+
+
+def export_email(message, mailbox_address):
+    """Renders a synthetic message as the RFC 5322 email a mailbox export would hold."""
+    sender = message["from"]["emailAddress"]
+    received = datetime.strptime(message["receivedDateTime"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    email = EmailMessage()
+    email["Received"] = f"from mail.example.gov by mx.example.gov; {format_datetime(received)}"
+    email["From"] = formataddr((sender["name"], sender["address"]))
+    email["To"] = mailbox_address
+    email["Subject"] = message["subject"]
+    email["Date"] = format_datetime(received - timedelta(seconds=5))
+    email["Message-ID"] = f"<{message['id']}@example.gov>"
+    email.set_content(message["body"]["content"])
+    return email
+
+
+def write_export(mailbox, path):
+    """
+    Writes all messages of a SyntheticMailbox, newest first, to an mbox file, or to a directory of
+    .eml files if path ends with a path separator or is an existing directory. Returns the count.
+    """
+    if path.endswith(("/", os.sep)) or os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+        for message in mailbox.messages:
+            with open(os.path.join(path, f"{message['id']}.eml"), "wb") as eml_file:
+                eml_file.write(bytes(export_email(message, mailbox.address)))
+    else:
+        mbox = mailbox_formats.mbox(path, create=True)
+        mbox.lock()
+        try:
+            for message in mailbox.messages:
+                mbox.add(export_email(message, mailbox.address))
+            mbox.flush()
+        finally:
+            mbox.unlock()
+            mbox.close()
+    return len(mailbox.messages)
+
+
+def add_server_arguments(parser):
+    """Options shared with bench_scan.py."""
+    parser.add_argument("--messages", type=int, default=2000, help="messages per synthetic mailbox")
+    parser.add_argument("--replies-per-sender", type=int, default=3, help="average survey replies per sender")
+    parser.add_argument("--noise-ratio", type=float, default=0.1, help="share of messages with an unrelated subject")
+    parser.add_argument("--unanswered-ratio", type=float, default=0.1, help="share of survey replies without an answer")
+    parser.add_argument("--body-chars", type=int, default=4096, help="approximate body size of each message")
+    parser.add_argument("--extra-surveys", type=int, default=0, choices=range(len(EXTRA_SURVEYS) + 1),
+                        help="further survey campaigns mixed into each mailbox")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every HTTP call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="probability that a call or batch item gets a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic data and the injected faults")
+
+
+def server_from_args(args, address=("127.0.0.1", 0)):
+    return MockGraphServer(
+        address, latency_ms=args.latency_ms, throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+        seed=args.seed, message_count=args.messages, replies_per_sender=args.replies_per_sender,
+        noise_ratio=args.noise_ratio, unanswered_ratio=args.unanswered_ratio, body_chars=args.body_chars,
+        extra_surveys=args.extra_surveys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--write-export", metavar="PATH",
+                        help="write the mailbox to an mbox file (or .eml files if PATH ends with /) instead of serving it")
+    parser.add_argument("--mailbox", default="survey.bench@example.gov", help="mailbox address used with --write-export")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, (args.host, args.port))
+    if args.write_export:
+        count = write_export(server.get_mailbox(args.mailbox), args.write_export)
+        server.server_close()
+        print(f"Wrote {count} messages of {args.mailbox} to {args.write_export}")
+        return
+    print(f"Mock Graph server listening on {server.base_url} (set GRAPH_BASE_URL to this). Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(server.counters), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,37 @@
 import os
 import csv
+import argparse
+import cProfile
+import io
+import json
+import pstats
+import sqlite3
 from dotenv import load_dotenv
 import logging
 import re
-from datetime import datetime, timezone
+import html
+import mmap
+from datetime import datetime, timezone, timedelta
+import time
+import random
+import secrets
+import signal
+import sys
+import queue
+import threading
 import traceback
-from O365 import Account, MSGraphProtocol
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser, BytesParser
+from email.utils import parseaddr, parsedate_to_datetime
+from functools import partial, lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from O365 import Account, Connection, MSGraphProtocol
 
 # Load environment variables from .env file
 load_dotenv()
@@ -51,19 +77,583 @@ TENANT_ID = os.getenv("TENANT_ID")
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 PROCESSED_FOLDER_NAME = os.getenv("PROCESSED_FOLDER_NAME")
-CSV_BACKUP_TIMESTAMP_FORMAT = "_%Y%m%d_%H%M%S"
 
 OUTPUT_DIR = "output"
 OUTPUT_CSV_FILENAME = os.getenv("OUTPUT_CSV_FILE") # Get the filename from .env
 OUTPUT_CSV_FILE_PATH = os.path.join(OUTPUT_DIR, OUTPUT_CSV_FILENAME) if OUTPUT_CSV_FILENAME else None
+OUTPUT_FILE_STEM = os.path.join(OUTPUT_DIR, os.path.splitext(OUTPUT_CSV_FILENAME)[0]) if OUTPUT_CSV_FILENAME else None
+# Optional JSON file defining several surveys scanned together in one pass (see "Scanning Several Surveys"
+# in the readme). It replaces TARGET_SUBJECT, SEARCH_QUESTION, OUTPUT_CSV_FILE and PROCESSED_FOLDER_NAME.
+SURVEYS_FILE = os.getenv("SURVEYS_FILE")
+if SURVEYS_FILE:
+    # Each survey has its own CSV and store; the sync state, metrics and profiles are named after the rules file
+    OUTPUT_FILE_STEM = os.path.join(OUTPUT_DIR, os.path.splitext(os.path.basename(SURVEYS_FILE))[0])
+CSV_FIELDNAMES = ["Sender Name", "Sender Email", "Date Received", "Answer", "Last Updated"]
 
 # Ensure output directory exists
 if OUTPUT_DIR and not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
 
+def _env_int(name, default):
+    """Reads an integer setting from the environment, falling back to the default if unset or invalid."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning(f"Invalid integer value '{value}' for {name}. Using default {default}.")
+        return default
+
+def _env_bool(name, default):
+    """Reads a true/false setting from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def _env_list(name, default):
+    """Reads a '|'-separated list setting from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return list(default)
+    return [item.strip() for item in value.split("|") if item.strip()]
+
+# --- Response Store Settings ---
+# Records live in an SQLite database keyed on the lowercased sender email; the CSV is exported from it.
+STATE_DB_FILE_PATH = os.getenv("STATE_DB_FILE") or (f"{OUTPUT_FILE_STEM}.sqlite3" if OUTPUT_FILE_STEM else None)
+# "on_change" exports the CSV after runs that changed the store, "never" only on --export-csv.
+CSV_EXPORT = (os.getenv("CSV_EXPORT") or "on_change").strip().lower()
+
+# --- Incremental Sync Settings ---
+# "full" re-scans the whole matching history on every run (original behavior).
+# "incremental" only asks Graph for messages received since the watermark saved by the last successful run.
+SYNC_MODE = (os.getenv("SYNC_MODE") or "full").strip().lower()
+# Minutes subtracted from the watermark so messages indexed slightly late are not missed.
+# Re-seeing a message is harmless: a record is only replaced by a strictly newer email.
+SYNC_OVERLAP_MINUTES = _env_int("SYNC_OVERLAP_MINUTES", 5)
+# How many result pages to process between checkpoints (0 disables checkpointing).
+CHECKPOINT_EVERY_PAGES = _env_int("CHECKPOINT_EVERY_PAGES", 1)
+SYNC_STATE_FILE_PATH = f"{OUTPUT_FILE_STEM}.sync_state.json" if OUTPUT_FILE_STEM else None
+
+# --- Batched Move Settings ---
+# Moves are sent through the Graph JSON $batch endpoint, which accepts at most 20 requests per call.
+GRAPH_BATCH_LIMIT = 20
+MOVE_BATCH_SIZE = max(1, min(_env_int("MOVE_BATCH_SIZE", GRAPH_BATCH_LIMIT), GRAPH_BATCH_LIMIT))
+MOVE_MAX_RETRIES = _env_int("MOVE_MAX_RETRIES", 3) # Retries for moves that fail with a transient status (429/5xx)
+
+# --- Scan Target Settings ---
+# Mailboxes (and optionally one folder each) to scan, separated by "|", e.g.
+# "surveys@example.gov|shared@example.gov:Inbox/Survey Replies". Defaults to the whole EMAIL_ADDRESS mailbox.
+SCAN_TARGETS = _env_list("SCAN_TARGETS", [])
+# Targets scanned in parallel, each with its own authenticated Account.
+SCAN_TARGET_WORKERS = max(1, _env_int("SCAN_TARGET_WORKERS", 4))
+
+# --- Offline Ingestion Settings ---
+# With --from-export PATH the replies are read from a mailbox export (an mbox file, or a directory of
+# .eml files) instead of Graph. Messages are parsed and answers extracted in a pool of processes.
+OFFLINE_WORKERS = max(1, _env_int("OFFLINE_WORKERS", os.cpu_count() or 1))
+OFFLINE_BATCH_SIZE = max(1, _env_int("OFFLINE_BATCH_SIZE", 2000)) # Messages read ahead and handed to the pool at a time
+
+# --- Watch Mode Settings ---
+# With --watch the script keeps running and scans for new replies every WATCH_POLL_SECONDS.
+WATCH_POLL_SECONDS = max(1, _env_int("WATCH_POLL_SECONDS", 15))
+# How often the sync state files and the CSV are written while watching (always also on exit).
+WATCH_FLUSH_SECONDS = max(0, _env_int("WATCH_FLUSH_SECONDS", 300))
+# Optional Graph change notifications: a receiver on this local port starts a scan as soon as a message arrives.
+# Graph posts to WATCH_WEBHOOK_URL, a public HTTPS address that must forward to the receiver (e.g. a reverse proxy).
+WATCH_WEBHOOK_PORT = _env_int("WATCH_WEBHOOK_PORT", 0)
+WATCH_WEBHOOK_URL = os.getenv("WATCH_WEBHOOK_URL")
+# Secret echoed back in every notification, so posts from anyone else are ignored
+WATCH_WEBHOOK_CLIENT_STATE = os.getenv("WATCH_WEBHOOK_CLIENT_STATE") or secrets.token_hex(16)
+WEBHOOK_SUBSCRIPTION_MINUTES = 2880 # Graph allows message subscriptions at most 4230 minutes (under 3 days); renewed when less than a day is left
+
+# --- Scan Pipeline Settings ---
+# Number of parser threads running answer extraction. 0 runs the scan fully serially.
+SCAN_WORKERS = _env_int("SCAN_WORKERS", 4)
+# Pages fetched ahead of the parser, and batches of moves waiting for the mover thread.
+SCAN_QUEUE_DEPTH = max(1, _env_int("SCAN_QUEUE_DEPTH", 2))
+
+# --- Two-Phase Scan Settings ---
+# Lists only message metadata first and downloads bodies just for the newest reply per sender that
+# would change the stored record.
+TWO_PHASE_SCAN = _env_bool("TWO_PHASE_SCAN", False)
+# Look for the answer in the bodyPreview (first 255 characters, listed with the metadata) before downloading anything.
+BODY_PREVIEW_FIRST = _env_bool("BODY_PREVIEW_FIRST", True)
+BODY_PREVIEW_CHARS = 255 # Length at which Graph cuts the bodyPreview
+# Body fields downloaded in turn until an answer is found, e.g. "uniqueBody|body" tries the reply without its quoted history first.
+TWO_PHASE_BODY_FIELDS = _env_list("TWO_PHASE_BODY_FIELDS", ["body"])
+
+# --- Server-Side Narrowing Settings ---
+def _env_datetime(name):
+    """Reads an ISO date or date-time setting (UTC unless it carries an offset), or None if unset or invalid."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        logging.warning(f"Invalid date value '{value}' for {name}. Ignoring it.")
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+# Only list emails received in this window (e.g. the survey campaign); either end may be left open.
+RECEIVED_AFTER = _env_datetime("RECEIVED_AFTER")
+RECEIVED_BEFORE = _env_datetime("RECEIVED_BEFORE")
+# "true" asks Graph for a KQL $search on the subject and SEARCH_QUESTION in the body instead of a $filter
+# on the subject alone. Graph does not combine $search with $filter, so the date window goes into
+# the KQL too, and a listing that leaves out the processed folder uses the $filter instead.
+SERVER_SEARCH = _env_bool("SERVER_SEARCH", False)
+# Graph returns at most this many messages for a $search, newest first, and silently drops the rest.
+# A search that reaches it is followed by the same listing with the $filter.
+SEARCH_RESULT_LIMIT = 1000
+# Leave emails already moved to PROCESSED_FOLDER_NAME out of whole-mailbox listings. Their answers are
+# in the response store, so they are still listed while the store is empty (first run or rebuild).
+# The run's own moves are then sent after the last page, as they take emails out of the listing.
+EXCLUDE_PROCESSED_FOLDER = _env_bool("EXCLUDE_PROCESSED_FOLDER", True)
+# Emails per result page ($top). Graph returns at most 999; smaller pages mean more requests but
+# smaller responses and more frequent checkpoints.
+PAGE_SIZE = max(1, min(_env_int("PAGE_SIZE", 999), 999))
+
+# --- Answer Extraction Settings ---
+# Other accepted phrasings of SEARCH_QUESTION (e.g. from an earlier version of the survey email)
+SEARCH_QUESTION_VARIANTS = _env_list("SEARCH_QUESTION_VARIANTS", [])
+# Phrases counted as a Yes or a No answer when they appear as whole words after the question
+ANSWER_YES_PHRASES = _env_list("ANSWER_YES_PHRASES", ["yes"])
+ANSWER_NO_PHRASES = _env_list("ANSWER_NO_PHRASES", ["no"])
+ANSWER_WINDOW_CHARS = _env_int("ANSWER_WINDOW_CHARS", 100) # How far after the question to look for the answer
+
+# --- Graph Endpoint Settings ---
+# Base URL of the Graph API. Only changed to point the script at a local stand-in server,
+# e.g. the one used by benchmarks/bench_scan.py.
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL") or MSGraphProtocol._protocol_url
+
+# --- Throttling Settings ---
+# Every Graph request goes through a scheduler that waits out throttling instead of failing the run.
+# Requests in flight at once; halved when Graph throttles and grown back by one per round of successes.
+# Exchange Online allows 4 concurrent requests per mailbox.
+GRAPH_MAX_CONCURRENCY = max(1, _env_int("GRAPH_MAX_CONCURRENCY", 4))
+GRAPH_MAX_RETRIES = _env_int("GRAPH_MAX_RETRIES", 6) # Retries per request throttled (429/503) or failing with a transient server error
+GRAPH_BACKOFF_BASE_SECONDS = _env_int("GRAPH_BACKOFF_BASE_SECONDS", 1) # First backoff when Graph sends no Retry-After, doubled on each retry
+GRAPH_BACKOFF_MAX_SECONDS = _env_int("GRAPH_BACKOFF_MAX_SECONDS", 60) # Upper bound for that backoff (a Retry-After is always honored in full)
+
+# --- Run Metrics Settings ---
+# Every run writes a summary of where its time went (per stage), the Graph requests and bytes per
+# endpoint and the per-message latency, as JSON and in the Prometheus text format. Set to "none" to skip a file.
+METRICS_FILE = os.getenv("METRICS_FILE") or (f"{OUTPUT_FILE_STEM}.metrics.json" if OUTPUT_FILE_STEM else None)
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE") or (f"{OUTPUT_FILE_STEM}.prom" if OUTPUT_FILE_STEM else None)
+METRICS_FILE = None if (METRICS_FILE or "").lower() == "none" else METRICS_FILE
+METRICS_TEXTFILE = None if (METRICS_TEXTFILE or "").lower() == "none" else METRICS_TEXTFILE
+METRICS_PREFIX = "mailboxscan" # Prefix of the Prometheus metric names
+# One INFO line per inspected email is costly on large mailboxes; "false" moves those lines to DEBUG.
+LOG_EACH_EMAIL = _env_bool("LOG_EACH_EMAIL", True)
+
+# --- Run Metrics ---
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_GRAPH_ID_AFTER = ("users", "messages", "mailFolders", "childFolders", "subscriptions") # Path segments followed by an ID
+
+def graph_endpoint(url):
+    """
+    Reduces a Graph URL to its endpoint with IDs replaced, e.g.
+    https://graph.microsoft.com/v1.0/users/a@b.gov/messages/AAMk..=/move -> /users/{id}/messages/{id}/move
+    """
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    if segments and segments[0] in ("v1.0", "beta"):
+        segments = segments[1:]
+    for index in range(1, len(segments)):
+        if segments[index - 1] in _GRAPH_ID_AFTER and not segments[index].startswith("$"):
+            segments[index] = "{id}"
+    # mailFolders('AAMk..') style keys
+    return "/" + "/".join(re.sub(r"\('[^']*'\)", "('{id}')", segment) for segment in segments)
+
+class RunMetrics:
+    """
+    Run-wide measurements, safe to update from every thread: wall time spent per stage, Graph
+    requests and bytes per endpoint and status, and a histogram of per-message latency (from the
+    moment a message's page arrived to the moment its record was decided). Stage times are summed
+    over threads, so with the pipeline on they can add up to more than the run's wall time.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.stages = {} # stage -> [seconds, calls]
+        self.graph_requests = {} # (method, endpoint, status) -> [requests, bytes sent, bytes received, seconds]
+        self.batch_items = {} # (method, endpoint, status) -> items sent inside $batch requests
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS_SECONDS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the time spent in the with block to the stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - started)
+
+    def add_stage_time(self, name, seconds):
+        with self.lock:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += 1
+
+    def timed_pages(self, pages, name="fetch_pages"):
+        """
+        Wraps a page iterator: the time spent waiting for each page is added to the stage, and each
+        (messages, next_link) page is yielded as (messages, next_link, received_at).
+        """
+        while True:
+            started = time.perf_counter()
+            try:
+                page_messages, next_link = next(pages)
+            except StopIteration:
+                return
+            finally:
+                self.add_stage_time(name, time.perf_counter() - started)
+            yield page_messages, next_link, time.perf_counter()
+
+    def record_request(self, method, url, status, bytes_sent, bytes_received, seconds):
+        key = (method, graph_endpoint(url), str(status))
+        with self.lock:
+            entry = self.graph_requests.setdefault(key, [0, 0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += bytes_sent
+            entry[2] += bytes_received
+            entry[3] += seconds
+
+    def record_batch_item(self, method, url, status):
+        key = (method, graph_endpoint(url), str(status))
+        with self.lock:
+            self.batch_items[key] = self.batch_items.get(key, 0) + 1
+
+    def observe_latency(self, seconds):
+        with self.lock:
+            self.latency_count += 1
+            self.latency_sum += seconds
+            for index, bound in enumerate(LATENCY_BUCKETS_SECONDS):
+                if seconds <= bound:
+                    self.latency_buckets[index] += 1
+                    break
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self, targets=(), success=True):
+        """The run summary as a JSON-ready dict."""
+        with self.lock:
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(LATENCY_BUCKETS_SECONDS, self.latency_buckets):
+                cumulative += bucket_count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self.latency_count
+            return {
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "wall_seconds": round(time.perf_counter() - self.started, 6),
+                "success": success,
+                "counters": dict(self.counters),
+                "stages": {name: {"seconds": round(seconds, 6), "calls": calls} for name, (seconds, calls) in sorted(self.stages.items())},
+                "graph_requests": [
+                    {"method": method, "endpoint": endpoint, "status": status, "requests": requests,
+                     "bytes_sent": bytes_sent, "bytes_received": bytes_received, "seconds": round(seconds, 6)}
+                    for (method, endpoint, status), (requests, bytes_sent, bytes_received, seconds) in sorted(self.graph_requests.items())
+                ],
+                "graph_batch_items": [
+                    {"method": method, "endpoint": endpoint, "status": status, "items": items}
+                    for (method, endpoint, status), items in sorted(self.batch_items.items())
+                ],
+                "message_latency_seconds": {"count": self.latency_count, "sum": round(self.latency_sum, 6), "buckets": buckets},
+                "targets": [dict(target.stats, name=target.name) for target in targets],
+            }
+
+    def write_json(self, summary, path):
+        with open(f"{path}.tmp", "w", encoding="utf-8") as json_file:
+            json.dump(summary, json_file, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def write_prometheus(self, summary, path):
+        """
+        Writes the summary in the Prometheus text format, for the node_exporter textfile collector.
+        The file is swapped in whole, so the collector never reads a partial file.
+        """
+        def labels(**values):
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values.values())
+            return "{" + ",".join(f'{name}="{value}"' for name, value in zip(values, escaped)) + "}"
+
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+            # A sample's suffix holds its labels, and for a histogram also _bucket/_sum/_count
+            lines.extend(f"{METRICS_PREFIX}_{name}{suffix} {value}" for suffix, value in samples)
+
+        metric("run_success", "gauge", "1 if the last run finished without errors.", [("", int(summary["success"]))])
+        metric("run_finished_timestamp_seconds", "gauge", "When the last run finished.",
+               [("", datetime.fromisoformat(summary["finished_at"]).timestamp())])
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.", [("", summary["wall_seconds"])])
+        metric("run_events", "gauge", "Messages inspected, answers recorded, moves and errors in the last run.",
+               [(labels(event=name), value) for name, value in sorted(summary["counters"].items())])
+        metric("stage_seconds", "gauge", "Time spent per stage in the last run, summed over threads.",
+               [(labels(stage=name), stage["seconds"]) for name, stage in summary["stages"].items()])
+        metric("stage_calls", "gauge", "Times each stage ran in the last run.",
+               [(labels(stage=name), stage["calls"]) for name, stage in summary["stages"].items()])
+        requests = summary["graph_requests"]
+        metric("graph_requests", "gauge", "Graph HTTP requests in the last run, including retries.",
+               [(labels(method=r["method"], endpoint=r["endpoint"], status=r["status"]), r["requests"]) for r in requests])
+        metric("graph_request_bytes", "gauge", "Bytes sent and received by Graph HTTP requests in the last run.",
+               [(labels(method=r["method"], endpoint=r["endpoint"], direction=direction), r[f"bytes_{direction}"])
+                for r in requests for direction in ("sent", "received")])
+        metric("graph_batch_items", "gauge", "Requests sent inside $batch calls in the last run.",
+               [(labels(method=i["method"], endpoint=i["endpoint"], status=i["status"]), i["items"]) for i in summary["graph_batch_items"]])
+        latency = summary["message_latency_seconds"]
+        metric("message_latency_seconds", "histogram", "Time from a message's page arriving to its record being decided.",
+               [("_bucket" + labels(le=bound), count) for bound, count in latency["buckets"].items()]
+               + [("_sum", latency["sum"]), ("_count", latency["count"])])
+        with open(f"{path}.tmp", "w", encoding="utf-8") as prom_file:
+            prom_file.write("\n".join(lines) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+METRICS = RunMetrics()
+
+def write_run_summary(targets=(), success=True):
+    """Writes the run summary to METRICS_FILE and METRICS_TEXTFILE (when set) and logs the slowest stages."""
+    summary = METRICS.summary(targets, success)
+    stages = sorted(summary["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True)
+    requests = sum(entry["requests"] for entry in summary["graph_requests"])
+    received = sum(entry["bytes_received"] for entry in summary["graph_requests"])
+    logging.info(f"Run took {summary['wall_seconds']:.1f}s: {requests} Graph request(s), {received / 1024:.0f} KiB received. Stage time: "
+                 + ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in stages[:6]))
+    for path, write in ((METRICS_FILE, METRICS.write_json), (METRICS_TEXTFILE, METRICS.write_prometheus)):
+        if path:
+            try:
+                write(summary, path)
+            except Exception as e:
+                logging.error(f"Could not write run summary to '{path}': {e}", exc_info=False)
+    return summary
+
+@contextmanager
+def profiling(mode):
+    """
+    Profiles the with block. "cpu" writes cProfile stats (main thread only) to <output>.pstats,
+    "memory" writes the top tracemalloc allocation sites to <output>.tracemalloc.txt.
+    """
+    if not mode:
+        yield
+        return
+    stem = OUTPUT_FILE_STEM or os.path.join(OUTPUT_DIR, "email_scanner")
+    if mode == "cpu":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{stem}.pstats")
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(25)
+            logging.info(f"CPU profile written to {stem}.pstats (view with: python -m pstats {stem}.pstats). Top functions:\n{report.getvalue()}")
+    else:
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(f"{stem}.tracemalloc.txt", "w", encoding="utf-8") as report:
+                report.write(f"Traced memory: current {current / 1024 / 1024:.1f} MiB, peak {peak / 1024 / 1024:.1f} MiB\n\n")
+                report.write("Largest allocation sites still held at the end of the run:\n")
+                for statistic in snapshot.statistics("lineno")[:50]:
+                    report.write(f"{statistic}\n")
+            logging.info(f"Memory profile written to {stem}.tracemalloc.txt (peak traced memory {peak / 1024 / 1024:.1f} MiB).")
+
+# --- Request Scheduling ---
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503) # Graph asks us to slow down; 500/502/504 are only retried
+
+def _retry_after_seconds(value):
+    """Parses a Retry-After header (seconds or an HTTP date). Returns None if missing or invalid."""
+    if value is None or not str(value).strip():
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(str(value)) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    """
+    Paces the Graph requests of all threads sharing a protocol.
+    In-flight requests are capped by an AIMD limit: each success adds 1/limit (one slot per round
+    of successes), each throttling episode halves it. A throttled response pauses every request
+    until its Retry-After has passed, or for a jittered exponential backoff if Graph sent none.
+    Counters record requests, retries, throttled responses and the time spent paused.
+    """
+    def __init__(self, max_concurrency, max_retries, backoff_base_seconds, backoff_max_seconds):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.limit = float(self.max_concurrency)
+        self.lowest_limit = self.limit
+        self.in_flight = 0
+        self.resume_at = 0.0 # time.monotonic() before which no request is sent
+        self.condition = threading.Condition()
+        self.requests = 0
+        self.retries = 0
+        self.throttled_responses = 0
+        self.throttled_seconds = 0.0
+
+    def acquire(self):
+        """Blocks until the throttling pause is over and a concurrency slot is free."""
+        with self.condition:
+            while True:
+                pause = self.resume_at - time.monotonic()
+                if pause > 0:
+                    self.condition.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    self.in_flight += 1
+                    self.requests += 1
+                    return
+
+    def release(self, throttled=False):
+        """Frees the slot taken by acquire(); an unthrottled request grows the limit additively."""
+        with self.condition:
+            self.in_flight -= 1
+            if not throttled:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt + 1: the Retry-After, else a jittered exponential backoff."""
+        if retry_after is not None:
+            return retry_after * random.uniform(1.0, 1.2) # Spread out the clients that were told the same time
+        return random.uniform(0.5, 1.0) * min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt)
+
+    def throttle(self, attempt, retry_after=None):
+        """
+        Records a throttled response. The first one of an episode halves the concurrency limit;
+        all requests then pause for the backoff delay. Returns the delay.
+        """
+        delay = self.backoff_delay(attempt, retry_after)
+        with self.condition:
+            now = time.monotonic()
+            self.retries += 1
+            self.throttled_responses += 1
+            if now >= self.resume_at:
+                # Responses throttled while a pause is already running belong to the same episode
+                self.limit = max(1.0, self.limit / 2)
+                self.lowest_limit = min(self.lowest_limit, self.limit)
+            if now + delay > self.resume_at:
+                self.throttled_seconds += now + delay - max(self.resume_at, now)
+                self.resume_at = now + delay
+            self.condition.notify_all()
+        return delay
+
+    def retry(self, attempt):
+        """Records a retry after a transient server error and returns how long that request should wait."""
+        with self.condition:
+            self.retries += 1
+        return self.backoff_delay(attempt)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled_responses": self.throttled_responses,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+                "concurrency_limit": int(self.limit),
+                "lowest_concurrency_limit": int(self.lowest_limit),
+            }
+
+class ThrottlingAdapter(HTTPAdapter):
+    """
+    Transport adapter that sends each request through a RequestScheduler, retrying responses
+    throttled with 429/503 (any method) or failing with 500/502/504 (GET only) up to the
+    scheduler's max_retries. The last response is returned as is.
+    """
+    def __init__(self, scheduler, **kwargs):
+        self.scheduler = scheduler
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            throttled = False
+            started = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+                throttled = response.status_code in THROTTLE_STATUSES
+            finally:
+                self.scheduler.release(throttled)
+            body = request.body or b""
+            received = int(response.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(response.content)
+            METRICS.record_request(request.method, request.url, response.status_code,
+                                   len(body.encode("utf-8") if isinstance(body, str) else body), received, time.perf_counter() - started)
+            retryable = throttled or (response.status_code in RETRYABLE_STATUSES and request.method == "GET")
+            if not retryable or attempt >= self.scheduler.max_retries:
+                return response
+            if throttled:
+                delay = self.scheduler.throttle(attempt, _retry_after_seconds(response.headers.get("Retry-After")))
+            else:
+                delay = self.scheduler.retry(attempt)
+            logging.warning(f"Graph answered {request.method} {request.path_url.split('?')[0]} with HTTP {response.status_code}. "
+                            f"Retrying in {delay:.1f}s (retry {attempt + 1} of {self.scheduler.max_retries}).")
+            response.content # Read the error body so the connection goes back to the pool
+            response.close()
+            if not throttled:
+                time.sleep(delay) # A throttling pause is waited out in acquire()
+            attempt += 1
+
+class ScheduledConnection(Connection):
+    """O365 connection whose session sends requests through a ThrottlingAdapter."""
+    def __init__(self, credentials, *, scheduler=None, **kwargs):
+        if scheduler:
+            # The scheduler paces requests; O365's own delay (200 ms before each request, one at a
+            # time per connection) would cap a mailbox at about 5 requests per second
+            kwargs.setdefault("requests_delay", 0)
+        super().__init__(credentials, **kwargs)
+        self.scheduler = scheduler
+
+    def get_session(self, load_token=False):
+        session = super().get_session(load_token=load_token)
+        if self.scheduler:
+            # Connection errors are still retried by urllib3; statuses are left to the scheduler
+            retry = Retry(total=self.request_retries, connect=self.request_retries, read=self.request_retries,
+                          backoff_factor=0.5, status_forcelist=None)
+            adapter = ThrottlingAdapter(self.scheduler, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+class GraphAccount(Account):
+    """Account whose connection uses the scheduler of its protocol (if the protocol has one)."""
+    connection_constructor = ScheduledConnection
+
+    def __init__(self, credentials, *, protocol=None, **kwargs):
+        super().__init__(credentials, protocol=protocol, scheduler=getattr(protocol, "scheduler", None), **kwargs)
 
 class CustomMSGraphProtocol(MSGraphProtocol):
-    """Custom protocol to set default headers for Graph API requests."""
+    """Custom protocol to set default headers for Graph API requests, holding the request scheduler of its accounts."""
+    _protocol_url = GRAPH_BASE_URL.rstrip("/") + "/"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = RequestScheduler(GRAPH_MAX_CONCURRENCY, GRAPH_MAX_RETRIES,
+                                          GRAPH_BACKOFF_BASE_SECONDS, GRAPH_BACKOFF_MAX_SECONDS)
+
     def get_session(self, **kwargs):
         session = super().get_session(**kwargs)
         session.headers.update({
@@ -74,212 +664,1512 @@ class CustomMSGraphProtocol(MSGraphProtocol):
         return session
 
 DEFAULT_PROTOCOL = CustomMSGraphProtocol()
+AUTH_LOCK = threading.Lock() # Accounts of parallel targets share the token cache file
+
+@lru_cache(maxsize=None)
+def get_protocol(mailbox_address_lc):
+    """
+    Returns the protocol used for a mailbox. Exchange Online throttles each mailbox separately,
+    so each mailbox gets its own protocol and request scheduler.
+    """
+    if EMAIL_ADDRESS and mailbox_address_lc == EMAIL_ADDRESS.lower():
+        return DEFAULT_PROTOCOL
+    return CustomMSGraphProtocol()
+
+def _phrase_trie_regex(phrases):
+    """
+    Compiles phrases into one regex source by merging them into a character trie, so all phrasings
+    are matched in a single pass and shared leading characters stay a literal prefix the regex
+    engine can scan for quickly. A whitespace run in a phrase matches 1-16 whitespace characters.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for word_index, word in enumerate(phrase.lower().split()):
+            if word_index:
+                node = node.setdefault(" ", {})
+            for char in word:
+                node = node.setdefault(char, {})
+        node[""] = {} # End of a phrase
+
+    def emit(node):
+        alternatives = [(r"\s{1,16}" if token == " " else re.escape(token)) + emit(child)
+                        for token, child in node.items() if token]
+        if not alternatives:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(alternatives) + ")?"
+        return alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+
+    return emit(trie)
+
+class AnswerExtractor:
+    """
+    Precompiled Yes/No answer extractor, built once per survey question.
+    All accepted phrasings of the question are compiled into one pattern, as are the Yes and No
+    phrasings. The body is lowercased a chunk at a time (starting small, since the question is
+    usually near the top of a reply) instead of copying the whole body, and the answer is the first
+    Yes or No phrasing within window_chars after the question.
+    """
+    FIRST_CHUNK_CHARS = 4096
+    MAX_CHUNK_CHARS = 65536
+
+    def __init__(self, questions, yes_phrases=("yes",), no_phrases=("no",), window_chars=100):
+        questions = [q for q in questions if q and q.strip()]
+        if not questions:
+            raise ValueError("AnswerExtractor needs at least one question phrasing.")
+        self.questions = questions
+        self.window_chars = window_chars
+        self.question_pattern = re.compile(_phrase_trie_regex(questions))
+        self.answer_pattern = re.compile(
+            rf"\b(?:(?P<yes>{_phrase_trie_regex(yes_phrases)})|(?P<no>{_phrase_trie_regex(no_phrases)}))\b")
+        # A chunk is extended by this much so a question starting near its end is matched whole,
+        # together with the answer window that follows it
+        self.chunk_overlap = max(len(q) + 16 * len(q.split()) for q in questions) + window_chars
+
+    def extract(self, text_body, complete=True):
+        """
+        Returns "Yes", "No" or None for the first answer found after the question in text_body.
+        complete=False means text_body is cut from a longer text (e.g. a full-length bodyPreview):
+        an answer ending where the text ends may be part of a longer word ("No" of "Not sure") and
+        gives None, so the caller looks at the whole text instead.
+        """
+        if not text_body:
+            return None
+        chunk_start = 0
+        chunk_size = self.FIRST_CHUNK_CHARS
+        while chunk_start < len(text_body):
+            chunk_end = chunk_start + chunk_size
+            chunk = text_body[chunk_start:chunk_end + self.chunk_overlap].lower()
+            # Only questions starting inside this chunk count; later ones are found by the next chunk
+            question_match = self.question_pattern.search(chunk)
+            if question_match and question_match.start() < chunk_size:
+                window_start = question_match.end()
+                answer_match = self.answer_pattern.search(chunk, window_start, window_start + self.window_chars)
+                if not answer_match:
+                    return None
+                if not complete and chunk_start + answer_match.end() >= len(text_body):
+                    return None
+                return "Yes" if answer_match.lastgroup == "yes" else "No"
+            chunk_start = chunk_end
+            chunk_size = min(chunk_size * 2, self.MAX_CHUNK_CHARS)
+        return None  # Question not found
+
+@lru_cache(maxsize=None)
+def get_answer_extractor(question):
+    """Returns the extractor for a question, built once. The configured question also accepts SEARCH_QUESTION_VARIANTS."""
+    questions = [question] + (SEARCH_QUESTION_VARIANTS if question == SEARCH_QUESTION else [])
+    return AnswerExtractor(questions, ANSWER_YES_PHRASES, ANSWER_NO_PHRASES, ANSWER_WINDOW_CHARS)
 
 def extract_answer(text_body, question):
     """
     Extracts 'Yes' or 'No' answer following the specified question in the text.
-    Searches within a limited window after the question.
+    Searches within a limited window (ANSWER_WINDOW_CHARS) after the question.
     """
     if not text_body or not question:
         logging.warning("extract_answer called with empty text_body or question.")
         return None
 
-    text_body_lower = text_body.lower()
-    question_lower = question.lower()
+    answer = get_answer_extractor(question).extract(text_body)
+    if answer is None:
+        logging.debug(f"No clear Yes/No answer found for question: '{question}'")
+    return answer
 
-    question_index = text_body_lower.find(question_lower)
-    if question_index == -1:
-        logging.debug(f"Question '{question}' not found in text body.")
-        return None  # Question not found
+# --- Survey Rules ---
+class Survey:
+    """
+    One survey: the subject its emails contain, the extractor for its question and answer phrasings,
+    and where its answers go (response store and CSV) and its processed emails are moved to.
+    rank is the survey's position in the rules file.
+    """
+    def __init__(self, name, subject, extractor, csv_path, state_db_path, processed_folder_name=None, rank=0):
+        self.name = name
+        self.subject = subject
+        self.extractor = extractor
+        self.csv_path = csv_path
+        self.state_db_path = state_db_path
+        self.processed_folder_name = processed_folder_name
+        self.rank = rank
+        self.store = None # Opened by open_response_stores
+
+class SurveyRules:
+    """
+    The surveys scanned together in one pass over each mailbox. Their subjects are compiled into one
+    combined matcher, a regex of optional lookaheads with one group per survey, so a single match
+    tells every survey an email's subject belongs to (case-insensitive containment, like Graph's
+    contains()), even when one survey's subject contains another's.
+    """
+    def __init__(self, surveys):
+        self.surveys = surveys
+        self.subject_pattern = re.compile(
+            "".join(f"(?:(?=.*?({re.escape(survey.subject)})))?" for survey in surveys), re.IGNORECASE | re.DOTALL)
+
+    def match_subject(self, subject):
+        """The surveys whose subject is contained in subject, in rules order."""
+        match = self.subject_pattern.match(subject or "")
+        return [survey for survey, found in zip(self.surveys, match.groups()) if found is not None]
+
+    def subjects(self):
+        """The distinct survey subjects."""
+        return list(dict.fromkeys(survey.subject for survey in self.surveys))
+
+    def questions(self):
+        """The distinct question phrasings of all surveys."""
+        return list(dict.fromkeys(question for survey in self.surveys for question in survey.extractor.questions))
+
+def load_survey_rules(path=SURVEYS_FILE):
+    """
+    Builds the SurveyRules from the rules file at path, a JSON document {"surveys": [{...}, ...]}
+    (see the readme for the keys), or without one a single survey from TARGET_SUBJECT,
+    SEARCH_QUESTION, OUTPUT_CSV_FILE and PROCESSED_FOLDER_NAME. An invalid rules file is logged and
+    yields no surveys, which run() reports.
+    """
+    if not path:
+        extractor = get_answer_extractor(SEARCH_QUESTION) if SEARCH_QUESTION else None # Required by run() before scanning
+        return SurveyRules([Survey("default", TARGET_SUBJECT or "", extractor, OUTPUT_CSV_FILE_PATH, STATE_DB_FILE_PATH, PROCESSED_FOLDER_NAME)])
+    surveys = []
+    try:
+        with open(path, 'r', encoding='utf-8') as rules_file:
+            entries = json.load(rules_file).get("surveys") or []
+        for rank, entry in enumerate(entries):
+            name = str(entry.get("name") or "").strip()
+            if not name or not entry.get("subject") or not entry.get("question"):
+                raise ValueError(f"survey {rank + 1} needs a name, a subject and a question")
+            if any(survey.name == name for survey in surveys):
+                raise ValueError(f"survey name '{name}' is used twice")
+            extractor = AnswerExtractor([entry["question"]] + list(entry.get("question_variants") or []),
+                                        entry.get("yes_phrases") or ANSWER_YES_PHRASES, entry.get("no_phrases") or ANSWER_NO_PHRASES,
+                                        int(entry.get("answer_window_chars") or ANSWER_WINDOW_CHARS))
+            slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+            csv_path = os.path.join(OUTPUT_DIR, entry.get("output_csv") or f"{slug}.csv")
+            state_db_path = entry.get("state_db") or f"{os.path.splitext(csv_path)[0]}.sqlite3"
+            if any(survey.state_db_path == state_db_path or survey.csv_path == csv_path for survey in surveys):
+                raise ValueError(f"survey '{name}' writes to the same CSV or response store as an earlier survey")
+            surveys.append(Survey(name, entry["subject"], extractor, csv_path, state_db_path, entry.get("processed_folder"), rank))
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        logging.critical(f"Could not load survey rules from '{path}': {e}")
+        return SurveyRules([])
+    return SurveyRules(surveys)
+
+SURVEY_RULES = load_survey_rules()
+
+def _parse_last_updated(value):
+    """Parses a stored "Last Updated" ISO timestamp, treating missing or invalid values as the oldest possible date."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+# --- Response Records ---
+# Records are compared on integer microseconds since the epoch rather than on datetime objects:
+# an int is a third of the size, compares faster, and converts exactly to the store's timestamps.
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+OLDEST_TIMESTAMP_US = (datetime.min.replace(tzinfo=timezone.utc) - EPOCH) // ONE_MICROSECOND
+
+def timestamp_us(dt):
+    """Microseconds since the epoch for a datetime (a naive one is taken as local time, like datetime.timestamp())."""
+    return (dt.astimezone(timezone.utc) - EPOCH) // ONE_MICROSECOND
+
+def parse_timestamp_us(value):
+    """Like _parse_last_updated, but returns microseconds since the epoch (OLDEST_TIMESTAMP_US if missing or invalid)."""
+    try:
+        return timestamp_us(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except (ValueError, AttributeError, OverflowError):
+        return OLDEST_TIMESTAMP_US
+
+class ResponseRecord:
+    """
+    One sender's newest answer: the CSV columns plus the answer's time in microseconds since the
+    epoch and the rank of the target it came from. Slotted, with the answer interned, so the
+    records held between checkpoints cost a few small objects each instead of two dicts.
+    """
+    __slots__ = ("sender_name", "sender_email", "date_received", "answer", "last_updated", "last_updated_us", "target_rank")
+
+    def __init__(self, sender_name, sender_email, date_received, answer, last_updated, last_updated_us, target_rank=0):
+        self.sender_name = sender_name
+        self.sender_email = sender_email # Original case, for the CSV
+        self.date_received = date_received
+        self.answer = sys.intern(answer) # "Yes"/"No": every record shares the same two strings
+        self.last_updated = last_updated # ISO format string
+        self.last_updated_us = last_updated_us
+        self.target_rank = target_rank # Breaks ties between equally new answers from different targets
+
+    def replaces(self, other):
+        """True if this record should replace other: it is strictly newer, or just as new and from a target listed earlier."""
+        return (self.last_updated_us > other.last_updated_us or
+                (self.last_updated_us == other.last_updated_us and self.target_rank < other.target_rank))
+
+    def store_row(self, sender_key):
+        """The record as a row of the responses table."""
+        return (sender_key, self.sender_name, self.sender_email, self.date_received, self.answer,
+                self.last_updated, self.last_updated_us / 1_000_000, self.target_rank)
+
+# --- Response Store ---
+class ResponseStore:
+    """
+    SQLite store holding the newest answer per sender, keyed on the lowercased sender email and
+    indexed on the last-updated time. A run looks up only the senders it sees and upserts only the
+    records it changed, in one transaction; the CSV is exported from the store by streaming rows.
+    Safe to share between the threads scanning several targets.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    sender_key TEXT PRIMARY KEY,
+                    sender_name TEXT,
+                    sender_email TEXT,
+                    date_received TEXT,
+                    answer TEXT,
+                    last_updated TEXT,
+                    last_updated_ts REAL NOT NULL,
+                    target_rank INTEGER NOT NULL DEFAULT 0
+                )""")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(responses)")}
+            if "target_rank" not in columns:
+                # Stores created before scan targets existed
+                self.conn.execute("ALTER TABLE responses ADD COLUMN target_rank INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_updated ON responses (last_updated_ts)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, sender_email_lc):
+        """Returns the stored ResponseRecord for a sender, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT sender_name, sender_email, date_received, answer, last_updated, last_updated_ts, target_rank "
+                "FROM responses WHERE sender_key = ?", (sender_email_lc,)).fetchone()
+        if row is None:
+            return None
+        # Timestamps are stored as float seconds, which round-trip to whole microseconds for any real date
+        last_updated_us = round(row[5] * 1_000_000) if row[5] > 0 else OLDEST_TIMESTAMP_US
+        return ResponseRecord(row[0], row[1], row[2], row[3], row[4], last_updated_us, row[6])
+
+    def upsert(self, records):
+        """
+        Writes the given {sender_email_lc: ResponseRecord} entries in a single transaction. A stored
+        record is only replaced by a strictly newer one, or by one just as new from a target listed
+        earlier in SCAN_TARGETS (see ResponseRecord.replaces), so the result does not depend on the
+        order targets finish in and replaying records after a crash is harmless.
+        Returns the number of rows inserted or updated.
+        """
+        rows = [record.store_row(key) for key, record in records.items()]
+        if not rows:
+            return 0
+        with self.lock, self.conn:
+            changes_before = self.conn.total_changes
+            self.conn.executemany("""
+                INSERT INTO responses (sender_key, sender_name, sender_email, date_received, answer, last_updated, last_updated_ts, target_rank)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sender_key) DO UPDATE SET
+                    sender_name = excluded.sender_name, sender_email = excluded.sender_email,
+                    date_received = excluded.date_received, answer = excluded.answer,
+                    last_updated = excluded.last_updated, last_updated_ts = excluded.last_updated_ts,
+                    target_rank = excluded.target_rank
+                WHERE excluded.last_updated_ts > responses.last_updated_ts
+                   OR (excluded.last_updated_ts = responses.last_updated_ts AND excluded.target_rank < responses.target_rank)""", rows)
+            changed = self.conn.total_changes - changes_before
+            if changed:
+                self._set_meta("csv_export_pending", "1")
+        return changed
+
+    def export_pending(self):
+        """True if the store changed since the CSV was last exported."""
+        with self.lock:
+            return self._get_meta("csv_export_pending") == "1"
+
+    def export_csv(self, filename):
+        """
+        Streams all records, sorted by sender email, into the CSV file. The file is written under a
+        temporary name and swapped in at the end, so readers never see a partial export.
+        """
+        temp_filename = f"{filename}.tmp"
+        count = 0
+        with self.lock, open(temp_filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(CSV_FIELDNAMES)
+            # The primary key index already returns rows in sender order, so nothing is sorted in memory
+            for row in self.conn.execute(
+                    "SELECT sender_name, sender_email, date_received, answer, last_updated FROM responses ORDER BY sender_key"):
+                writer.writerow(row)
+                count += 1
+        os.replace(temp_filename, filename)
+        with self.lock, self.conn:
+            self._set_meta("csv_export_pending", "0")
+        return count
+
+    def import_csv(self, filename):
+        """
+        One-time migration: loads records from a CSV written by earlier versions of the script.
+        Rows are streamed into the store in batches, so memory does not grow with the file.
+        """
+        with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None) or []
+            # Column positions by name, so CSVs with reordered or missing columns still load
+            positions = [header.index(name) if name in header else None for name in CSV_FIELDNAMES]
+            records = {}
+            imported = 0
+            for row in reader:
+                sender_name, sender_email, date_received, answer, last_updated = (
+                    row[i] if i is not None and i < len(row) else "" for i in positions)
+                sender_email_lc = sender_email.lower()
+                if sender_email_lc:
+                    records[sender_email_lc] = ResponseRecord(sender_name, sender_email, date_received, answer,
+                                                              last_updated, parse_timestamp_us(last_updated))
+                if len(records) >= 1000:
+                    imported += self.upsert(records)
+                    records = {}
+            imported += self.upsert(records)
+        with self.lock, self.conn:
+            self._set_meta("csv_export_pending", "0") # The CSV already holds these records
+        return imported
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+
+def open_response_store(survey):
+    """
+    Opens a survey's response store, importing its existing output CSV the first time so the
+    history collected by earlier versions of the script is kept.
+    """
+    store = ResponseStore(survey.state_db_path)
+    if store.count() == 0 and survey.csv_path and os.path.exists(survey.csv_path):
+        logging.info(f"Response store '{survey.state_db_path}' is empty. Importing existing records from '{survey.csv_path}'...")
+        with METRICS.stage("csv_import"):
+            imported = store.import_csv(survey.csv_path)
+        logging.info(f"Imported {imported} records into the response store.")
+    return store
+
+def open_response_stores(surveys):
+    """Opens the response store of each survey (as survey.store). Closes the ones already open if one fails."""
+    try:
+        for survey in surveys:
+            survey.store = open_response_store(survey)
+    except Exception:
+        close_response_stores(surveys)
+        raise
+
+def close_response_stores(surveys):
+    for survey in surveys:
+        if survey.store:
+            survey.store.close()
+            survey.store = None
+
+def save_pending_records(pending_records):
+    """
+    Writes {survey: {sender_email_lc: ResponseRecord}} to each survey's response store and clears
+    the written records. Returns the number of rows inserted or updated.
+    """
+    changed = 0
+    for survey, records in pending_records.items():
+        changed += survey.store.upsert(records)
+        records.clear()
+    return changed
+
+# --- Incremental Sync State ---
+# The state file holds the watermark (receivedDateTime of the newest message seen by the last
+# successful run) and, while a scan is in progress, a checkpoint with the next page link. Records
+# are written to the response store before each checkpoint, so a crashed or throttled run resumes
+# from the checkpoint on the next start without losing them. Each scan target has its own state file.
+
+def load_sync_state(path=SYNC_STATE_FILE_PATH):
+    """Loads the incremental sync state file. Returns an empty state if it is missing or unreadable."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except Exception as e:
+        logging.error(f"Could not read sync state file '{path}'. Starting without it. Error: {e}", exc_info=False)
+        return {}
+
+def _write_sync_state(state, path=SYNC_STATE_FILE_PATH):
+    """Writes the sync state atomically so a crash never leaves a half-written file behind."""
+    if not path:
+        return
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(temp_path, path)
+
+def save_checkpoint(state, query, next_link, max_received, pending_records, path=SYNC_STATE_FILE_PATH):
+    """
+    Persists scan progress. The records changed since the previous checkpoint are written to the
+    surveys' stores first (and removed from pending_records, see save_pending_records), then the
+    state file records the query being run, the link of the next page to fetch (None once all
+    pages are done), the newest receivedDateTime seen so far and the surveys scanned for.
+    """
+    save_pending_records(pending_records)
+    state["checkpoint"] = {
+        "query": query,
+        "next_link": next_link,
+        "max_received": max_received.isoformat() if max_received else None,
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+        "surveys": [survey.name for survey in pending_records],
+    }
+    try:
+        _write_sync_state(state, path)
+        logging.debug(f"Checkpoint saved (next page: {'yes' if next_link else 'none'}).")
+    except Exception as e:
+        logging.error(f"Could not save checkpoint to '{path}': {e}", exc_info=False)
+
+def promote_checkpoint(state, run_started_at):
+    """
+    Promotes the newest receivedDateTime of the checkpoint in state to the watermark and clears the
+    checkpoint, provided the scan started at run_started_at ran to the last page. Returns True if
+    state was changed.
+    """
+    checkpoint = state.get("checkpoint")
+    if not checkpoint or checkpoint.get("next_link"):
+        # Nothing to commit, or the scan stopped part-way and must be resumed first.
+        return False
+    if _parse_last_updated(checkpoint.get("saved_at")) < run_started_at:
+        # Left over from an earlier run whose results were never saved; this run did not finish a scan.
+        return False
+    if checkpoint.get("max_received"):
+        previous_watermark = state.get("watermark")
+        if not previous_watermark or _parse_last_updated(checkpoint["max_received"]) > _parse_last_updated(previous_watermark):
+            state["watermark"] = checkpoint["max_received"]
+    if checkpoint.get("surveys") is not None:
+        state["surveys"] = checkpoint["surveys"] # The surveys the watermark applies to
+    state.pop("checkpoint", None)
+    state["last_successful_run"] = datetime.now(timezone.utc).isoformat()
+    return True
+
+def commit_sync_state(run_started_at, path=SYNC_STATE_FILE_PATH):
+    """Called once the results are safely saved. Promotes the checkpoint in the state file (see promote_checkpoint)."""
+    state = load_sync_state(path)
+    if not promote_checkpoint(state, run_started_at):
+        return
+    try:
+        _write_sync_state(state, path)
+        logging.info(f"Sync state '{path}' committed. Watermark is now {state.get('watermark')}.")
+    except Exception as e:
+        logging.error(f"Could not commit sync state to '{path}': {e}", exc_info=False)
+
+def _kql_phrase(text):
+    """Quotes text as a KQL phrase; Graph's $search value is itself in double quotes, so inner ones are escaped."""
+    return '\\"' + " ".join(re.sub(r'["\\]', " ", text).split()) + '\\"'
+
+def build_messages_query(watermark=None, incremental=SYNC_MODE == "incremental", exclude_folder_ids=(), search=SERVER_SEARCH):
+    """
+    Builds the query parameters that narrow the message listing on the server: the subject of any
+    survey in SURVEY_RULES, the RECEIVED_AFTER/RECEIVED_BEFORE window, the watermark in incremental
+    mode and, given exclude_folder_ids, leaving out the processed folders. Returns {"$filter": ...},
+    or {"$search": ...} with search=True (which ignores exclude_folder_ids). The result also
+    identifies the query in checkpoints.
+    """
+    subjects = SURVEY_RULES.subjects()
+    since = None
+    if incremental and watermark:
+        since = _parse_last_updated(watermark) - timedelta(minutes=SYNC_OVERLAP_MINUTES)
+    if RECEIVED_AFTER and (since is None or RECEIVED_AFTER > since):
+        since = RECEIVED_AFTER
+
+    if search:
+        subject_terms = [f"subject:{_kql_phrase(subject)}" for subject in subjects]
+        terms = [subject_terms[0] if len(subject_terms) == 1 else "(" + " OR ".join(subject_terms) + ")",
+                 "(" + " OR ".join(f"body:{_kql_phrase(question)}" for question in SURVEY_RULES.questions()) + ")"]
+        # KQL compares whole days in the mailbox's time zone, so the window is widened by a day on
+        # each side and trimmed to the exact times on the client (see in_search_scope)
+        if since:
+            terms.append(f"received>={(since - timedelta(days=1)).astimezone(timezone.utc):%Y-%m-%d}")
+        if RECEIVED_BEFORE:
+            terms.append(f"received<={(RECEIVED_BEFORE + timedelta(days=1)).astimezone(timezone.utc):%Y-%m-%d}")
+        return {"$search": '"' + " AND ".join(terms) + '"'}
+
+    clauses = []
+    if since:
+        clauses.append(f"receivedDateTime ge {since.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
+    elif TWO_PHASE_SCAN:
+        # Graph only sorts a filtered listing by a property that the filter also starts with
+        clauses.append("receivedDateTime ge 1900-01-01T00:00:00Z")
+    if RECEIVED_BEFORE:
+        clauses.append(f"receivedDateTime lt {RECEIVED_BEFORE.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
+    subject_clauses = [f"contains(subject, '{subject.replace(chr(39), chr(39) * 2)}')" for subject in subjects]
+    clauses.append(subject_clauses[0] if len(subject_clauses) == 1 else "(" + " or ".join(subject_clauses) + ")")
+    for folder_id in exclude_folder_ids:
+        clauses.append(f"parentFolderId ne '{folder_id}'")
+    return {"$filter": " and ".join(clauses)}
+
+def in_search_scope(message):
+    """
+    Client-side part of a SERVER_SEARCH query: True if a message (Graph JSON) is in the exact
+    RECEIVED_AFTER/RECEIVED_BEFORE window.
+    """
+    received = message.get("receivedDateTime")
+    if received and (RECEIVED_AFTER or RECEIVED_BEFORE):
+        received_dt = _parse_last_updated(received)
+        if (RECEIVED_AFTER and received_dt < RECEIVED_AFTER) or (RECEIVED_BEFORE and received_dt >= RECEIVED_BEFORE):
+            return False
+    return True
+
+def iter_message_pages(mailbox, params, next_link=None, raw=False, keep=None):
+    """
+    Yields (messages, next_link) for each page of the mailbox message listing.
+    When next_link is given (resuming from a checkpoint) the listing continues from that page.
+    With raw=True the messages are the JSON dicts returned by Graph instead of Message objects.
+    keep, if given, is called with each message's JSON and drops the message when it returns False.
+    mailbox may also be a Folder, whose messages are listed instead of the whole mailbox's.
+    """
+    if mailbox.root:
+        endpoint = mailbox._endpoints.get("root_messages")
+    else:
+        endpoint = mailbox._endpoints.get("folder_messages").format(id=mailbox.folder_id)
+    url = next_link or mailbox.build_url(endpoint)
+    request_params = None if next_link else params
+    while url:
+        response = mailbox.con.get(url, params=request_params)
+        if not response:
+            return
+        data = response.json()
+        url = data.get("@odata.nextLink")
+        request_params = None # The next link already carries the query parameters
+        page = data.get("value", [])
+        if keep:
+            page = [message for message in page if keep(message)]
+        if raw:
+            yield page, url
+            continue
+        messages = [
+            mailbox.message_constructor(parent=mailbox, download_attachments=False, **{mailbox._cloud_data_key: message})
+            for message in page
+        ]
+        yield messages, url
+
+def iter_search_pages(mailbox, params, fallback_params, next_link=None, raw=False, keep=None):
+    """
+    iter_message_pages for a $search listing. Graph stops a $search at SEARCH_RESULT_LIMIT messages
+    without saying so, so a search that returns that many is followed by the listing with
+    fallback_params (the same query as a $filter). Messages seen twice change no record twice.
+    A next_link saved from the $filter part resumes that part.
+    """
+    link_query = dict(parse_qsl(urlsplit(next_link).query)) if next_link else {}
+    if not next_link or "$search" in link_query:
+        listed = int(link_query.get("$skip") or 0)
 
-    search_window_start = question_index + len(question)
-    search_window_end = min(search_window_start + 100, len(text_body_lower))
-    text_after_question = text_body_lower[search_window_start:search_window_end]
+        def counted(message):
+            nonlocal listed
+            listed += 1
+            return keep(message) if keep else True
 
-    match_yes = re.search(r'\byes\b', text_after_question)
-    match_no = re.search(r'\bno\b', text_after_question)
+        yield from iter_message_pages(mailbox, params, next_link, raw=raw, keep=counted)
+        if listed < SEARCH_RESULT_LIMIT:
+            return
+        logging.warning(f"The $search returned Graph's limit of {SEARCH_RESULT_LIMIT} emails, so older ones may be missing. "
+                        f"Listing again with $filter. Narrow the search with RECEIVED_AFTER or turn SERVER_SEARCH off to avoid this.")
+        next_link = None
+    yield from iter_message_pages(mailbox, fallback_params, next_link, raw=raw, keep=keep)
 
-    if match_yes and match_no:
-        if match_yes.start() < match_no.start():
-            logging.debug(f"Found 'Yes' (before 'No') for question: '{question}'")
-            return "Yes"
+# --- Graph JSON Batching ---
+def _batch_relative_url(mailbox, endpoint):
+    """$batch expects URLs relative to the service root, e.g. /users/{mailbox}/messages/{id}/move"""
+    return mailbox.build_url(endpoint)[len(mailbox.protocol.service_url) - 1:]
+
+def send_graph_batch(mailbox, requests, max_retries, description="request"):
+    """
+    Sends up to GRAPH_BATCH_LIMIT requests (dicts with method, url and optional body/headers)
+    through the Graph JSON $batch endpoint. Items that are throttled (429/503), fail with a server
+    error or are missing from the response are retried. Throttled items are reported to the
+    connection's RequestScheduler, which pauses all requests for the longest Retry-After (or a
+    jittered backoff). Returns one response item per request, in request order; requests that
+    never succeeded carry their last status (0 if the batch call itself failed).
+    """
+    batch_url = f"{mailbox.protocol.service_url}$batch"
+    scheduler = getattr(mailbox.con, "scheduler", None)
+    results = {request_id: {"status": 0} for request_id in range(1, len(requests) + 1)}
+    remaining = dict(enumerate(requests, start=1)) # request id -> request
+    throttled = False
+    delay = 0
+    for attempt in range(max_retries + 1):
+        if attempt:
+            logging.info(f"Retrying {len(remaining)} {description}(s) in {delay:.1f}s.")
+            if not throttled:
+                time.sleep(delay) # A throttling pause is waited out by the scheduler before the next call
+        payload = {"requests": [dict(request, id=str(request_id)) for request_id, request in remaining.items()]}
+        throttled = False
+        retry_after = None
+        try:
+            response = mailbox.con.post(batch_url, data=payload)
+            responses = response.json().get("responses", []) if response else []
+        except Exception as batch_err:
+            logging.warning(f"Batch of {len(remaining)} {description}(s) failed (attempt {attempt + 1}): {batch_err}")
+            responses = []
+
+        retry_requests = {}
+        for item in responses:
+            request_id = int(item.get("id", 0))
+            if request_id not in remaining:
+                continue
+            results[request_id] = item
+            status = item.get("status", 0)
+            METRICS.record_batch_item(remaining[request_id]["method"], remaining[request_id]["url"], status)
+            if status in RETRYABLE_STATUSES:
+                retry_requests[request_id] = remaining[request_id]
+                if status in THROTTLE_STATUSES:
+                    throttled = True
+                    header_wait = _retry_after_seconds((item.get("headers") or {}).get("Retry-After"))
+                    if header_wait is not None:
+                        retry_after = max(retry_after or 0, header_wait)
+        # Requests missing from the response are treated as transient failures
+        answered_ids = {int(item.get("id", 0)) for item in responses}
+        retry_requests.update({request_id: request for request_id, request in remaining.items() if request_id not in answered_ids})
+        remaining = retry_requests
+        if not remaining or attempt == max_retries:
+            break
+        if scheduler is None:
+            delay = retry_after if retry_after is not None else 2 ** attempt
+            throttled = False
+        elif throttled:
+            delay = scheduler.throttle(attempt, retry_after)
         else:
-            logging.debug(f"Found 'No' (before 'Yes') for question: '{question}'")
-            return "No"
-    elif match_yes:
-        logging.debug(f"Found 'Yes' for question: '{question}'")
-        return "Yes"
-    elif match_no:
-        logging.debug(f"Found 'No' for question: '{question}'")
-        return "No"
-
-    logging.debug(f"No clear Yes/No answer found for question: '{question}'")
+            delay = scheduler.retry(attempt)
+    return [results[request_id] for request_id in range(1, len(requests) + 1)]
+
+# --- Two-Phase Scan ---
+def collect_two_phase_candidates(mailbox, query, keep=None, fallback_query=None):
+    """
+    Phase one of the two-phase scan: lists only the id, sender, date and preview of the messages
+    matching query (see build_messages_query), and keeps for each survey the subject matches and
+    each sender the messages newer than the sender's record in that survey's store. keep is
+    passed on to iter_message_pages. A $search query needs fallback_query (see iter_search_pages).
+    Returns ({(survey, sender_email_lc): [message dicts, newest first]}, newest receivedDateTime seen).
+    """
+    def listing_params(query):
+        params = dict(query, **{
+            "$select": "id,subject,from,receivedDateTime,bodyPreview,parentFolderId",
+            "$top": PAGE_SIZE,
+        })
+        if "$filter" in query:
+            params["$orderby"] = "receivedDateTime desc" # A $search cannot be sorted; candidates are sorted below
+        return params
+
+    if "$search" in query:
+        listing = iter_search_pages(mailbox, listing_params(query), listing_params(fallback_query), raw=True, keep=keep)
+    else:
+        listing = iter_message_pages(mailbox, listing_params(query), raw=True, keep=keep)
+
+    candidates = {}
+    stored_us = {} # (survey, sender_email_lc) -> stored record's last_updated_us (None if the sender has no record)
+    single_survey = SURVEY_RULES.surveys if len(SURVEY_RULES.surveys) == 1 else None
+    max_received_dt = None
+    listed_count = 0
+    for page, _ in listing:
+        for message in page:
+            listed_count += 1
+            if not message.get("receivedDateTime"):
+                continue # Without a date the message can never replace a record
+            received_dt = _parse_last_updated(message["receivedDateTime"])
+            if max_received_dt is None or received_dt > max_received_dt:
+                max_received_dt = received_dt
+            sender_email = ((message.get("from") or {}).get("emailAddress") or {}).get("address") or "N/A"
+            sender_email_lc = sender_email.lower()
+            for survey in single_survey or SURVEY_RULES.match_subject(message.get("subject")):
+                key = (survey, sender_email_lc)
+                if key not in stored_us:
+                    existing_record = survey.store.get(sender_email_lc)
+                    stored_us[key] = existing_record.last_updated_us if existing_record else None
+                if stored_us[key] is None or timestamp_us(received_dt) > stored_us[key]:
+                    candidates.setdefault(key, []).append(message)
+    for sender_candidates in candidates.values():
+        # Already newest first for a sorted listing; sort() keeps equal dates in listing order
+        sender_candidates.sort(key=lambda message: _parse_last_updated(message["receivedDateTime"]), reverse=True)
+    logging.info(f"Two-phase scan: listed {listed_count} email(s); {len(candidates)} sender(s) have replies newer than their stored record (counted per survey).")
+    return candidates, max_received_dt
+
+def iter_two_phase_pages(mailbox, candidates, failed=None):
+    """
+    Phase two of the two-phase scan: for each survey and sender, finds the newest candidate that
+    holds an answer to the survey's question by trying its bodyPreview, then each of
+    TWO_PHASE_BODY_FIELDS (downloaded in $batch requests), then moving on to the sender's
+    next-newest candidate.
+    Yields (messages, None) pages with one Message per resolved survey and sender, whose body is
+    the text the answer was found in. A Message whose body is a full-length bodyPreview has
+    body_complete=False, so parse_message reads it as cut text. Candidates whose body could not be
+    downloaded are appended to the list failed, if given.
+    """
+    first_field = -1 if BODY_PREVIEW_FIRST else 0 # -1 stands for the bodyPreview
+
+    def next_attempt(key, candidate_index, field_index):
+        """What to try after a miss, or None once the sender has no candidate left."""
+        if field_index + 1 < len(TWO_PHASE_BODY_FIELDS):
+            return (key, candidate_index, field_index + 1)
+        if candidate_index + 1 < len(candidates[key]):
+            return (key, candidate_index + 1, first_field)
+        return None
+
+    def as_message(message, text, complete=True):
+        data = dict(message, body={"contentType": "text", "content": text})
+        msg = mailbox.message_constructor(parent=mailbox, download_attachments=False, **{mailbox._cloud_data_key: data})
+        msg.body_complete = complete # Other surveys matching the subject are also read from this text
+        return msg
+
+    attempts = [(key, 0, first_field) for key in candidates]
+    while attempts:
+        found = []
+        to_fetch = []
+        for attempt in attempts:
+            # The preview came with the metadata, so checking it costs no request
+            while attempt and attempt[2] == -1:
+                message = candidates[attempt[0]][attempt[1]]
+                preview = message.get("bodyPreview") or ""
+                complete = len(preview) < BODY_PREVIEW_CHARS
+                if attempt[0][0].extractor.extract(preview, complete=complete):
+                    found.append(as_message(message, preview, complete))
+                    attempt = None
+                else:
+                    attempt = (attempt[0], attempt[1], 0)
+            if attempt:
+                to_fetch.append(attempt)
+        if found:
+            yield found, None
+
+        attempts = []
+        for batch_start in range(0, len(to_fetch), GRAPH_BATCH_LIMIT):
+            batch = to_fetch[batch_start:batch_start + GRAPH_BATCH_LIMIT]
+            requests = [{
+                "method": "GET",
+                "url": _batch_relative_url(mailbox, mailbox._endpoints.get("message").format(id=candidates[key][candidate_index]["id"]))
+                       + f"?$select={TWO_PHASE_BODY_FIELDS[field_index]}",
+                "headers": {"Prefer": 'outlook.body-type="text"'},
+            } for key, candidate_index, field_index in batch]
+            found = []
+            for attempt, response in zip(batch, send_graph_batch(mailbox, requests, MOVE_MAX_RETRIES, "body download")):
+                key, candidate_index, field_index = attempt
+                (survey, sender_email_lc) = key
+                message = candidates[key][candidate_index]
+                field = TWO_PHASE_BODY_FIELDS[field_index]
+                status = response.get("status", 0)
+                if not 200 <= status < 300:
+                    # Leave the sender unchanged rather than fall back to an older reply; the next run retries it
+                    logging.error(f"Failed to download {field} of email ID {message['id']}: HTTP {status}. Sender '{sender_email_lc}' not updated.", exc_info=False)
+                    if failed is not None:
+                        failed.append(message)
+                    continue
+                text = (((response.get("body") or {}).get(field)) or {}).get("content") or ""
+                if survey.extractor.extract(text):
+                    found.append(as_message(message, text))
+                else:
+                    follow_up = next_attempt(key, candidate_index, field_index)
+                    if follow_up:
+                        attempts.append(follow_up)
+            if found:
+                yield found, None
+
+def hold_back_watermark(max_received_dt, failed_messages):
+    """
+    The newest receivedDateTime a two-phase scan may record when the bodies of failed_messages
+    (Graph JSON) could not be downloaded: just below the oldest of them, so the next run (or poll)
+    lists them again.
+    """
+    if max_received_dt is None or not failed_messages:
+        return max_received_dt
+    oldest_failed_dt = min(_parse_last_updated(message["receivedDateTime"]) for message in failed_messages)
+    return min(max_received_dt, oldest_failed_dt - ONE_MICROSECOND)
+
+class MoveQueue:
+    """
+    Collects message moves and sends them to Graph as JSON $batch requests of up to
+    MOVE_BATCH_SIZE moves each, instead of one HTTPS round trip per message. Each move has its own
+    destination, so the processed folders of several surveys share the batches.
+    Items that fail with a transient status (429/5xx) are retried; other failures are logged.
+    With hold=True nothing is sent until flush(), for a listing that the moves would shrink while
+    it is being paged.
+    """
+    def __init__(self, mailbox, hold=False):
+        self.mailbox = mailbox
+        self.hold = hold
+        self.pending = [] # (message ID, destination folder ID) pairs waiting to be sent
+        self.folder_names = {} # Destination folder ID -> display name, for logging
+        self.moved_count = 0
+        self.failed_count = 0
+
+    def add(self, message_id, folder):
+        """Queues a message for moving to folder and sends a batch as soon as a full one is collected (unless held)."""
+        folder_id = getattr(folder, 'folder_id', None) or folder
+        self.folder_names.setdefault(folder_id, getattr(folder, 'name', folder_id))
+        self.pending.append((message_id, folder_id))
+        if not self.hold and len(self.pending) >= MOVE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Sends all queued moves."""
+        while self.pending:
+            batch = self.pending[:MOVE_BATCH_SIZE]
+            del self.pending[:MOVE_BATCH_SIZE]
+            self._send_batch(batch)
+
+    def close(self):
+        """Sends the remaining moves. Called once at the end of the scan."""
+        self.flush()
+
+    def _move_request(self, message_id, folder_id):
+        return {
+            "method": "POST",
+            "url": _batch_relative_url(self.mailbox, self.mailbox._endpoints.get("message").format(id=message_id) + "/move"),
+            "body": {"destinationId": folder_id},
+            "headers": {"Content-Type": "application/json"},
+        }
+
+    def _send_batch(self, batch):
+        requests = [self._move_request(message_id, folder_id) for message_id, folder_id in batch]
+        with METRICS.stage("move"):
+            responses = send_graph_batch(self.mailbox, requests, MOVE_MAX_RETRIES, "move")
+        for (message_id, folder_id), item in zip(batch, responses):
+            status = item.get("status", 0)
+            if 200 <= status < 300:
+                self.moved_count += 1
+                logging.debug(f"Moved email ID {message_id} to folder '{self.folder_names[folder_id]}'.")
+            else:
+                self.failed_count += 1
+                error_message = ((item.get("body") or {}).get("error") or {}).get("message", "")
+                logging.error(f"Failed to move email ID {message_id}: HTTP {status} {error_message}", exc_info=False)
+
+class MoveStage:
+    """
+    Pipeline stage that runs a MoveQueue on its own thread, so batched moves overlap with page
+    fetching and parsing. Exposes the same add/flush/close interface as MoveQueue.
+    """
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, move_queue, depth):
+        self.move_queue = move_queue
+        self.inbox = queue.Queue(maxsize=depth) # Bounded, so a slow mailbox applies back-pressure
+        self.thread = threading.Thread(target=self._run, name="mover", daemon=True)
+        self.thread.start()
+
+    @property
+    def moved_count(self):
+        return self.move_queue.moved_count
+
+    @property
+    def failed_count(self):
+        return self.move_queue.failed_count
+
+    def add(self, message_id, folder):
+        self.inbox.put((message_id, folder))
+
+    def flush(self):
+        """Blocks until every move queued so far has been sent."""
+        self.inbox.put(self._FLUSH)
+        self.inbox.join()
+
+    def close(self):
+        """Sends the remaining moves and stops the mover thread."""
+        self.inbox.put(self._STOP)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            try:
+                if item is self._STOP:
+                    self.move_queue.flush()
+                    return
+                elif item is self._FLUSH:
+                    self.move_queue.flush()
+                else:
+                    self.move_queue.add(*item)
+            except Exception as move_err:
+                logging.error(f"Mover stage failed to send queued moves: {move_err}", exc_info=False)
+            finally:
+                self.inbox.task_done()
+
+def prefetch_pages(page_iterator, depth):
+    """
+    Runs page_iterator on a producer thread, keeping up to `depth` pages fetched ahead of the consumer.
+    Errors raised while fetching are re-raised in the consuming thread.
+    """
+    page_queue = queue.Queue(maxsize=depth)
+    stop_event = threading.Event()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                page_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in page_iterator:
+                if not put(("page", page)):
+                    return
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+
+    producer = threading.Thread(target=produce, name="page-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, item = page_queue.get()
+            if kind == "page":
+                yield item
+            elif kind == "error":
+                raise item
+            else:
+                return
+    finally:
+        stop_event.set() # Lets the producer exit if the consumer stops early
+
+def parse_message(msg):
+    """
+    Extracts the sender, dates and survey answers from a message: "answers" maps the rank of each
+    survey whose subject the message matches to "Yes", "No" or None. A message from a two-phase scan
+    may carry body_complete=False (its body is a cut bodyPreview, see AnswerExtractor.extract).
+    Runs on the parser worker threads, so it only reads the message and never touches shared state.
+    """
+    received_dt = msg.received
+    email_body = msg.body
+    # Graph only listed the message because its subject matched; with one survey there is nothing to route
+    surveys = SURVEY_RULES.surveys if len(SURVEY_RULES.surveys) == 1 else SURVEY_RULES.match_subject(msg.subject)
+    return {
+        "id": msg.object_id,
+        "subject": msg.subject,
+        "sender_name": msg.sender.name if msg.sender else "N/A",
+        "sender_email": msg.sender.address if msg.sender else "N/A",
+        "received_dt": received_dt,
+        # Store dates in ISO format for easier parsing and consistency
+        # O365's received_dt is already timezone-aware (usually UTC)
+        "received_date_iso": received_dt.isoformat() if received_dt else None,
+        "received_date_str": received_dt.strftime("%Y-%m-%d %H:%M:%S %Z") if received_dt else "N/A", # For display/CSV if preferred
+        "has_body": bool(email_body),
+        "answers": timed_extract_answers(surveys, email_body, getattr(msg, "body_complete", True)) if email_body else {},
+    }
+
+def timed_extract_answers(surveys, email_body, complete=True):
+    started = time.perf_counter()
+    try:
+        return {survey.rank: survey.extractor.extract(email_body, complete) for survey in surveys}
+    finally:
+        METRICS.add_stage_time("extract_answer", time.perf_counter() - started)
+
+# --- Offline Ingestion ---
+class ExportSource:
+    """
+    Reads survey replies from a mailbox export instead of Graph: an mbox file, or a directory of .eml
+    files (searched recursively, in name order). Messages are streamed in pages of
+    OFFLINE_BATCH_SIZE, and an mbox file is memory-mapped and split on its "From " lines, so only
+    the pages being parsed are in memory however large the export is.
+    """
+    def __init__(self, path, batch_size=OFFLINE_BATCH_SIZE):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Mailbox export '{path}' not found.")
+        self.path = path
+        self.batch_size = batch_size
+
+    def iter_pages(self):
+        """Yields (items, None) pages for parse_exported_message; an item is (location, raw bytes or None for an .eml path)."""
+        items = self._iter_eml_files() if os.path.isdir(self.path) else self._iter_mbox_messages()
+        page = []
+        for item in items:
+            page.append(item)
+            if len(page) >= self.batch_size:
+                yield page, None
+                page = []
+        if page:
+            yield page, None
+
+    def _iter_eml_files(self):
+        for directory, subdirectories, filenames in os.walk(self.path):
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(".eml"):
+                    yield os.path.join(directory, filename), None # Read by the worker, not sent to it
+
+    def _iter_mbox_messages(self):
+        with open(self.path, "rb") as mbox_file:
+            try:
+                data = mmap.mmap(mbox_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return # Empty file
+            except OSError:
+                # Not mappable (e.g. a pipe): read it a line at a time instead
+                yield from self._iter_mbox_lines(mbox_file)
+                return
+            with data:
+                if data[:5] == b"From ":
+                    position = 0
+                else:
+                    position = data.find(b"\nFrom ") + 1
+                    if not position:
+                        return # No "From " separator: not an mbox file
+                index = 0
+                while True:
+                    message_start = data.find(b"\n", position) + 1 # Skip the "From " separator line
+                    if not message_start:
+                        return
+                    separator = data.find(b"\nFrom ", message_start - 1)
+                    message_end = separator + 1 if separator != -1 else len(data)
+                    yield f"{self.path}#{index}", data[message_start:message_end]
+                    if separator == -1:
+                        return
+                    position = message_end
+                    index += 1
+
+    def _iter_mbox_lines(self, mbox_file):
+        index, lines = 0, None
+        for line in mbox_file:
+            if line.startswith(b"From "):
+                if lines is not None:
+                    yield f"{self.path}#{index}", b"".join(lines)
+                    index += 1
+                lines = []
+            elif lines is not None:
+                lines.append(line)
+        if lines is not None:
+            yield f"{self.path}#{index}", b"".join(lines)
+
+def _export_received(headers):
+    """
+    When the mailbox received an exported message: the date of its topmost Received header (added
+    by the last server, like Graph's receivedDateTime), falling back to the Date header.
+    Naive dates are taken as UTC.
+    """
+    candidates = [str(received).rpartition(";")[2] for received in (headers.get_all("Received") or [])[:1]]
+    candidates.append(str(headers.get("Date") or ""))
+    for candidate in candidates:
+        try:
+            received_dt = parsedate_to_datetime(candidate.strip())
+        except (TypeError, ValueError, IndexError):
+            continue
+        return received_dt if received_dt.tzinfo else received_dt.replace(tzinfo=timezone.utc)
     return None
 
-def scan_emails():
+def _export_header(headers, name):
+    """A header of an exported message with RFC 2047 encoded words decoded."""
+    value = headers.get(name)
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, ValueError, UnicodeError):
+        return str(value)
+
+def _export_text_body(message):
+    """The text of a parsed message: its first text/plain part, or its HTML part with the markup removed."""
+    parts = {}
+    for part in message.walk():
+        subtype = part.get_content_subtype() if part.get_content_maintype() == "text" else None
+        if subtype in ("plain", "html") and subtype not in parts and part.get_content_disposition() != "attachment":
+            parts[subtype] = part
+    part = parts.get("plain") or parts.get("html")
+    if part is None:
+        return ""
+    payload = part.get_payload(decode=True) or b""
+    try:
+        content = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+    except LookupError: # Unknown charset
+        content = payload.decode("utf-8", errors="replace")
+    if part is not parts.get("plain"):
+        content = re.sub(r"(?is)<(script|style)\b.*?</\1\s*>", " ", content)
+        content = html.unescape(re.sub(r"(?s)<[^>]+>", " ", content))
+    return content
+
+def parse_exported_message(item):
+    """
+    Process pool worker: parses one (location, raw) item of an ExportSource into the same dict as
+    parse_message. Returns None if the subject matches no survey or the message was received
+    outside RECEIVED_AFTER/RECEIVED_BEFORE, i.e. if Graph would not have listed it.
+    The headers are checked before the body is parsed. The parser uses the compat32 policy, which
+    is several times faster than the default one and enough for the headers read here.
+    """
+    location, raw = item
+    try:
+        if raw is None:
+            with open(location, "rb") as eml_file:
+                raw = eml_file.read()
+        headers = BytesHeaderParser().parsebytes(raw)
+        subject = _export_header(headers, "Subject")
+        surveys = SURVEY_RULES.match_subject(subject)
+        if not surveys:
+            return None
+        received_dt = _export_received(headers)
+        if received_dt and ((RECEIVED_AFTER and received_dt < RECEIVED_AFTER) or (RECEIVED_BEFORE and received_dt >= RECEIVED_BEFORE)):
+            return None
+        if received_dt:
+            received_dt = received_dt.astimezone(DEFAULT_PROTOCOL.timezone) # As O365 converts receivedDateTime
+        sender_name, sender_email = parseaddr(_export_header(headers, "From"))
+        email_body = _export_text_body(BytesParser().parsebytes(raw))
+    except Exception as e:
+        logging.warning(f"Could not read exported message '{location}': {e}")
+        return None
+    return {
+        "id": (headers.get("Message-ID") or location).strip(),
+        "subject": subject,
+        "sender_name": sender_name if sender_email else "N/A",
+        "sender_email": sender_email or "N/A",
+        "received_dt": received_dt,
+        "received_date_iso": received_dt.isoformat() if received_dt else None,
+        "received_date_str": received_dt.strftime("%Y-%m-%d %H:%M:%S %Z") if received_dt else "N/A",
+        "has_body": bool(email_body),
+        "answers": {survey.rank: survey.extractor.extract(email_body) for survey in surveys} if email_body else {},
+    }
+
+# --- Scan Targets ---
+class ScanTarget:
+    """
+    A mailbox, optionally narrowed to one folder, scanned with its own Account and sync state file.
+    rank is the target's position in SCAN_TARGETS; equally new answers from two targets go to the lower rank.
+    """
+    def __init__(self, mailbox_address, folder_path=None, rank=0):
+        self.mailbox_address = mailbox_address
+        self.folder_path = folder_path
+        self.rank = rank
+        self.name = f"{mailbox_address}:{folder_path}" if folder_path else mailbox_address
+        if not folder_path and EMAIL_ADDRESS and mailbox_address.lower() == EMAIL_ADDRESS.lower():
+            self.state_path = SYNC_STATE_FILE_PATH # Same file as before scan targets existed
+        elif OUTPUT_FILE_STEM:
+            slug = re.sub(r"[^a-z0-9]+", "_", self.name.lower()).strip("_")
+            self.state_path = f"{OUTPUT_FILE_STEM}.sync_state.{slug}.json"
+        else:
+            self.state_path = None
+        self.stats = {} # Filled in by scan_emails
+        # Kept between scans in watch mode, so a poll costs only the listing request
+        self.account = None
+        self.mailbox = None # Mailbox or Folder whose messages are listed
+        self.processed_folders = {} # Survey -> folder its processed emails are moved to
+        self.sync_state = None
+
+def get_scan_targets():
+    """Parses SCAN_TARGETS ("mailbox" or "mailbox:Folder/Subfolder" entries), defaulting to the EMAIL_ADDRESS mailbox."""
+    targets = []
+    for rank, entry in enumerate(SCAN_TARGETS or [EMAIL_ADDRESS]):
+        mailbox_address, _, folder_path = entry.partition(":")
+        targets.append(ScanTarget(mailbox_address.strip(), folder_path.strip().strip("/") or None, rank))
+    return targets
+
+def resolve_folder_path(mailbox, folder_path):
+    """Looks up a folder such as "Inbox/Survey Replies" one display name at a time, starting at the mailbox root."""
+    folder = mailbox
+    for folder_name in folder_path.split("/"):
+        folder = folder.get_folder(folder_name=folder_name.strip())
+        if folder is None:
+            raise ValueError(f"Folder '{folder_path}' not found (no folder named '{folder_name.strip()}').")
+    return folder
+
+def scan_emails(target=None, watch=False, source=None):
     """
     Connects to Outlook via Microsoft Graph API, scans emails, and extracts information.
     Handles login/token acquisition before attempting to scan.
+    Scans one ScanTarget (by default the whole EMAIL_ADDRESS mailbox) for all surveys in
+    SURVEY_RULES in a single pass, and fills in its stats.
+    Existing records are looked up in each survey's response store; changes are written to it at each checkpoint.
+    With watch=True (one poll of watch mode) the target's account and folders are reused, only
+    messages newer than the watermark are listed, and the sync state is kept in target.sync_state
+    instead of being written to its file.
+    With an ExportSource the messages are read from a mailbox export instead of Graph; the records
+    are the same, and nothing is moved.
+    Returns the records changed since the last checkpoint (not yet in the stores, {survey: {sender_email_lc: record}})
+    and whether anything changed.
     """
-    # Use a dictionary to store/update records by sender_email for efficient updates
-    # Key: sender_email (lowercase), Value: {"Sender Name": ..., "Sender Email": ..., "Date Received": ..., "Answer": ..., "Last Updated": datetime_object}
-    current_records = {}
+    target = target or ScanTarget(EMAIL_ADDRESS)
+    surveys = SURVEY_RULES.surveys
+    scan_started = time.perf_counter()
+    scan_started_at = datetime.now(timezone.utc)
+    log_progress = logging.debug if watch else logging.info # Polls that find nothing stay out of the INFO log
+    log_email = logging.info if LOG_EACH_EMAIL else logging.debug
+    # Records added or updated by this run that are not yet written to the stores
+    # Key: Survey, Value: {sender_email (lowercase): ResponseRecord}
+    pending_records = {survey: {} for survey in surveys}
     data_changed_during_scan = False # Flag to track if any record was added or updated
-    logging.info("Attempting to authenticate with Microsoft Graph API via O365 library...")
 
     # --- Authentication and Account Setup using O365 library ---
-    try:
-        credentials = (CLIENT_ID, CLIENT_SECRET)
-        account = Account(credentials, auth_flow_type='credentials', tenant_id=TENANT_ID, protocol=DEFAULT_PROTOCOL)
-
-        if not account.is_authenticated:
-            logging.info("Account not yet authenticated. Attempting authentication...")
-            if not account.authenticate(scopes=['https://graph.microsoft.com/.default']):
-                logging.critical(
-                    "Failed to authenticate with O365 library. "
-                    "Please check .env for TENANT_ID, CLIENT_ID, CLIENT_SECRET, "
-                    "Azure AD app permissions (e.g., Mail.Read - Application), and admin consent. "
-                    "Also, verify application access policies if applicable."
-                )
-                return current_records, data_changed_during_scan # Return empty records and no changes
-        
-        logging.info("Authenticated successfully. Ready to scan emails.")
+    if source is None and target.account is None:
+        logging.info("Attempting to authenticate with Microsoft Graph API via O365 library...")
+        try:
+            credentials = (CLIENT_ID, CLIENT_SECRET)
+            account = GraphAccount(credentials, auth_flow_type='credentials', tenant_id=TENANT_ID,
+                                   protocol=get_protocol(target.mailbox_address.lower()))
 
-    except Exception as e:
-        logging.critical(f"An unexpected error occurred during Microsoft Graph API authentication setup: {e}. Exiting.", exc_info=False)
-        return current_records, data_changed_during_scan # Return empty records and no changes
+            with AUTH_LOCK, METRICS.stage("auth"):
+                if not account.is_authenticated:
+                    logging.info("Account not yet authenticated. Attempting authentication...")
+                    if not account.authenticate(scopes=['https://graph.microsoft.com/.default']):
+                        logging.critical(
+                            "Failed to authenticate with O365 library. "
+                            "Please check .env for TENANT_ID, CLIENT_ID, CLIENT_SECRET, "
+                            "Azure AD app permissions (e.g., Mail.Read - Application), and admin consent. "
+                            "Also, verify application access policies if applicable."
+                        )
+                        target.stats = {"error": "authentication failed"}
+                        return pending_records, data_changed_during_scan # Return empty records and no changes
+            
+            logging.info("Authenticated successfully. Ready to scan emails.")
+            target.account = account
 
-    # --- Load existing CSV data ---
-    logging.info(f"Attempting to load previous responses from '{OUTPUT_CSV_FILE_PATH}' if it exists...")
-    if OUTPUT_CSV_FILE_PATH and os.path.exists(OUTPUT_CSV_FILE_PATH):
-        try:
-            with open(OUTPUT_CSV_FILE_PATH, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    sender_email_lc = row.get("Sender Email", "").lower()
-                    if sender_email_lc:
-                        # Store the last updated timestamp as a datetime object for comparison
-                        try:
-                            # Assuming "Last Updated" is stored in ISO format or similar parsable format
-                            last_updated_dt = datetime.fromisoformat(row.get("Last Updated").replace("Z", "+00:00"))
-                        except (ValueError, AttributeError):
-                            # Fallback if "Last Updated" is missing or not parsable, treat as old
-                            last_updated_dt = datetime.min.replace(tzinfo=timezone.utc)
-                        row_data = row.copy()
-                        row_data["Last Updated DT"] = last_updated_dt # Store actual datetime object
-                        current_records[sender_email_lc] = row_data
-            logging.info(f"Loaded {len(current_records)} existing records from {OUTPUT_CSV_FILE_PATH}.")
         except Exception as e:
-            logging.error(f"Could not read existing CSV {OUTPUT_CSV_FILE_PATH}. Will proceed as if creating a new one. Error: {e}", exc_info=False)
-            current_records = {} # Start fresh if read fails
+            logging.critical(f"An unexpected error occurred during Microsoft Graph API authentication setup: {e}. Exiting.", exc_info=False)
+            target.stats = {"error": str(e)}
+            return pending_records, data_changed_during_scan # Return empty records and no changes
+    account = target.account
+
+    for survey in surveys:
+        log_progress(f"Using response store '{survey.state_db_path}' with {survey.store.count()} existing records for survey '{survey.name}'.")
+
+    # --- Resume from checkpoint / incremental watermark ---
+    if watch:
+        if target.sync_state is None:
+            target.sync_state = load_sync_state(target.state_path)
+        sync_state = target.sync_state
+        state_path = None # Written by the watch loop on its flush cadence
+    else:
+        sync_state = load_sync_state(target.state_path)
+        state_path = target.state_path
+    watermark = sync_state.get("watermark")
+    survey_names = [survey.name for survey in surveys]
+    # A survey added since the last successful scan has not seen the older replies yet, including those
+    # already moved to another survey's processed folder
+    surveys_changed = sync_state.get("surveys", survey_names) != survey_names
+    if surveys_changed:
+        logging.info(f"The surveys changed since the last scan of '{target.name}'. Scanning the full history once, processed folders included.")
+        watermark = None
+    resume_next_link = None
+    max_received_dt = None
+    if source is None and (watch or SYNC_MODE == "incremental"):
+        log_progress(f"Incremental sync: watermark is {watermark or 'not set (first run scans all history)'}.")
 
     # --- Email Scanning using O365 library ---
+    move_queue = None
+    hold_moves = False
+    pages = None
+    failed_downloads = ()
+    parse_executor = None
+    scan_error = None
+    emails_inspected_count = 0
+    emails_with_answer_count = 0
+    queued_move_ids = set()
     try:
-        logging.info(f"Searching for emails in '{EMAIL_ADDRESS}' with subject containing: '{TARGET_SUBJECT}'")
+        subjects_text = " or ".join(f"'{subject}'" for subject in SURVEY_RULES.subjects())
+        log_progress(f"Searching for emails in '{target.name}' with subject containing: {subjects_text}")
         
-        # Get or create the folder for processed emails
-        # Note: This requires Mail.ReadWrite permissions for the application.
-        processed_folder = None
-        if PROCESSED_FOLDER_NAME:
-            logging.info(f"Attempting to get or create processed folder: '{PROCESSED_FOLDER_NAME}'")
-            mailbox_for_folders = account.mailbox(resource=EMAIL_ADDRESS) # Ensure we use the correct mailbox context
-            processed_folder = mailbox_for_folders.get_folder_by_name(PROCESSED_FOLDER_NAME)
-            if not processed_folder:
-                logging.info(f"Folder '{PROCESSED_FOLDER_NAME}' not found. Attempting to create it.")
-                # new_folder creates it at the root of the mailbox (same level as Inbox)
-                processed_folder = mailbox_for_folders.new_folder(PROCESSED_FOLDER_NAME)
-                logging.info(f"Folder '{PROCESSED_FOLDER_NAME}' created successfully.")
-            else:
-                logging.info(f"Successfully retrieved folder '{PROCESSED_FOLDER_NAME}'.")
+        any_messages_found = False
+        pages_since_checkpoint = 0
+        # processed_sender_answers set is no longer needed with the new update logic
+
+        if source is not None:
+            # Offline: the export is read on the prefetch thread and parsed in a process pool; the
+            # subject and date window Graph would have applied are checked by the workers
+            query_key = f"export={source.path}"
+            pages = prefetch_pages(METRICS.timed_pages(source.iter_pages(), "read_export"), SCAN_QUEUE_DEPTH)
+            parse_executor = ProcessPoolExecutor(max_workers=OFFLINE_WORKERS)
+            parse_page = partial(parse_executor.map, parse_exported_message,
+                                 chunksize=max(1, OFFLINE_BATCH_SIZE // (OFFLINE_WORKERS * 4)))
         else:
-            logging.warning("PROCESSED_FOLDER_NAME is not set. Emails will not be moved.")
+            if target.mailbox is None:
+                folders_started = time.perf_counter()
+                # Get or create the folder for processed emails of each survey (surveys may share one)
+                # Note: This requires Mail.ReadWrite permissions for the application.
+                processed_folders = {}
+                folders_by_name = {}
+                mailbox_for_folders = account.mailbox(resource=target.mailbox_address) # Ensure we use the correct mailbox context
+                for survey in surveys:
+                    folder_name = survey.processed_folder_name
+                    if not folder_name:
+                        logging.warning(f"No processed folder is set for survey '{survey.name}'. Its emails will not be moved.")
+                        continue
+                    if folder_name not in folders_by_name:
+                        logging.info(f"Attempting to get or create processed folder: '{folder_name}'")
+                        processed_folder = mailbox_for_folders.get_folder(folder_name=folder_name)
+                        if not processed_folder:
+                            logging.info(f"Folder '{folder_name}' not found. Attempting to create it.")
+                            # create_child_folder on the mailbox creates it at the root (same level as Inbox)
+                            processed_folder = mailbox_for_folders.create_child_folder(folder_name)
+                            logging.info(f"Folder '{folder_name}' created successfully.")
+                        else:
+                            logging.info(f"Successfully retrieved folder '{folder_name}'.")
+                        folders_by_name[folder_name] = processed_folder
+                    processed_folders[survey] = folders_by_name[folder_name]
 
-        mailbox = account.mailbox(resource=EMAIL_ADDRESS)
+                mailbox = account.mailbox(resource=target.mailbox_address)
+                if target.folder_path:
+                    mailbox = resolve_folder_path(mailbox, target.folder_path)
+                target.mailbox, target.processed_folders = mailbox, processed_folders
+                METRICS.add_stage_time("folders", time.perf_counter() - folders_started)
+            mailbox, processed_folders = target.mailbox, target.processed_folders
 
-        odata_filter = f"contains(subject, '{TARGET_SUBJECT}')"
-        select_fields = ['id', 'subject', 'from', 'receivedDateTime', 'body']
-        
-        messages_generator = mailbox.get_messages(
-            query=odata_filter, 
-            select=select_fields, 
-            limit=None, # Fetch all matching messages
-            download_attachments=False
-        )
-
-        emails_inspected_count = 0
-        emails_with_answer_count = 0
-        any_messages_found = False
-        # processed_sender_answers set is no longer needed with the new update logic
+            # A folder listing never includes the processed folders, which are at the top of the mailbox.
+            # Each is left out once its survey's store holds answers.
+            exclude_folder_ids = ()
+            if EXCLUDE_PROCESSED_FOLDER and mailbox.root and not surveys_changed:
+                exclude_folder_ids = tuple(dict.fromkeys(
+                    folder.folder_id for survey, folder in processed_folders.items() if survey.store.count()))
+            # Page links continue the listing with $skip, so moving emails out of a folder, or into an
+            # excluded processed folder, while it is listed would skip as many unseen emails. Those moves
+            # are held until the last page. A two-phase scan lists everything before it moves anything.
+            hold_moves = not TWO_PHASE_SCAN and (not mailbox.root or bool(exclude_folder_ids))
+            if processed_folders:
+                move_queue = MoveQueue(mailbox, hold=hold_moves)
+            incremental = watch or SYNC_MODE == "incremental"
+            # A $search cannot leave a folder out, so the processed folders' emails would be downloaded
+            # again on every run (and count towards SEARCH_RESULT_LIMIT); the $filter is used instead
+            search = SERVER_SEARCH and not exclude_folder_ids
+            query = build_messages_query(watermark, incremental, exclude_folder_ids, search)
+            fallback_query = build_messages_query(watermark, incremental, search=False) if search else None
+            # Identifies the query in checkpoints (a plain $filter string, as before $search was supported)
+            query_key = query.get("$filter") or f"$search={query['$search']}"
+            keep = in_search_scope if search else None
+            log_progress(f"Listing emails with {next(iter(query))}={next(iter(query.values()))}")
 
-        for msg in messages_generator:
-            any_messages_found = False
-            emails_inspected_count += 1
-            logging.info(f"Processing email {emails_inspected_count}: ID='{msg.object_id}', Subject='{msg.subject}'")
+            checkpoint = sync_state.get("checkpoint")
+            if checkpoint and checkpoint.get("query") == query_key:
+                # Records found before the previous run stopped were written to the store with its checkpoint
+                resume_next_link = checkpoint.get("next_link")
+                if checkpoint.get("max_received"):
+                    max_received_dt = _parse_last_updated(checkpoint["max_received"])
+                logging.info(f"Resuming from checkpoint saved at {checkpoint.get('saved_at')}: "
+                             f"{'continuing from the saved page' if resume_next_link else 'no page left to resume, starting the query again'}.")
+            elif checkpoint:
+                logging.warning("Discarding checkpoint from a previous run because it was made for a different query.")
 
-            sender_name = msg.sender.name if msg.sender else "N/A"
-            sender_email = msg.sender.address if msg.sender else "N/A"
-            
-            received_dt = msg.received
-            # Store dates in ISO format for easier parsing and consistency
-            # O365's received_dt is already timezone-aware (usually UTC)
-            received_date_iso = received_dt.isoformat() if received_dt else None
-            received_date_str = received_dt.strftime("%Y-%m-%d %H:%M:%S %Z") if received_dt else "N/A" # For display/CSV if preferred
-            logging.debug(f"  From: {sender_name} <{sender_email}>, Date: {received_date_str}")
-
-            email_body = msg.body
-            if not email_body:
-                logging.warning(f"Email ID {msg.object_id} has no textual body content. Skipping.")
-                continue
+            select_fields = ['id', 'subject', 'from', 'receivedDateTime', 'body']
+            query_params = dict(query, **{
+                "$select": ",".join(select_fields),
+                "$top": PAGE_SIZE,
+            })
 
-            answer = extract_answer(email_body, SEARCH_QUESTION)
-            if answer:
-                sender_email_lc = sender_email.lower()
-                new_record_data = {
-                    "Sender Name": sender_name or "",
-                    "Sender Email": sender_email, # Store original case for CSV
-                    "Date Received": received_date_str, # Or received_date_iso for consistency
-                    "Answer": answer,
-                    "Last Updated": received_date_iso, # ISO format string
-                    "Last Updated DT": received_dt # datetime object for comparison
-                }
-
-                if sender_email_lc in current_records:
-                    existing_record = current_records[sender_email_lc]
-                    # Compare based on the datetime object of the email
-                    if received_dt and received_dt > existing_record.get("Last Updated DT", datetime.min.replace(tzinfo=timezone.utc)):
-                        logging.info(f"Updating record for sender '{sender_email}'. Old answer: '{existing_record.get('Answer')}' on {existing_record.get('Last Updated')}. New answer: '{answer}' on {received_date_iso} (Email ID {msg.object_id}).")
-                        current_records[sender_email_lc] = new_record_data
-                        data_changed_during_scan = True
-                        emails_with_answer_count += 1 # Count as an update
-                        # Move email if it resulted in an update
-                        if processed_folder:
-                            try:
-                                logging.info(f"Moving updated email ID {msg.object_id} to folder '{PROCESSED_FOLDER_NAME}'.")
-                                msg.move(processed_folder)
-                            except Exception as move_err:
-                                logging.error(f"Failed to move email ID {msg.object_id}: {move_err}", exc_info=False)
+            if TWO_PHASE_SCAN:
+                # Bodies are only downloaded for replies that would change a record. There is no page link
+                # to resume from; an interrupted run simply lists the metadata again.
+                with METRICS.stage("list_candidates"):
+                    candidates, max_listed_dt = collect_two_phase_candidates(mailbox, query, keep, fallback_query)
+                if max_listed_dt and (max_received_dt is None or max_listed_dt > max_received_dt):
+                    max_received_dt = max_listed_dt
+                failed_downloads = []
+                pages = METRICS.timed_pages(iter_two_phase_pages(mailbox, candidates, failed_downloads), "fetch_bodies")
+            elif search:
+                fallback_params = dict(fallback_query, **{"$select": query_params["$select"], "$top": PAGE_SIZE})
+                pages = METRICS.timed_pages(iter_search_pages(mailbox, query_params, fallback_params, resume_next_link, keep=keep))
+            else:
+                pages = METRICS.timed_pages(iter_message_pages(mailbox, query_params, resume_next_link, keep=keep))
+            if SCAN_WORKERS > 0:
+                # Pipeline: pages are prefetched on a producer thread while the current page is parsed by
+                # the worker pool and moves are sent by the mover thread. Results are merged below in
+                # listing order, so the records are identical to a serial run.
+                pages = prefetch_pages(pages, SCAN_QUEUE_DEPTH)
+                parse_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="parser")
+                parse_page = partial(parse_executor.map, parse_message)
+                if move_queue and not hold_moves:
+                    move_queue = MoveStage(move_queue, SCAN_QUEUE_DEPTH * MOVE_BATCH_SIZE)
+            else:
+                parse_page = partial(map, parse_message)
+
+        for page_messages, next_link, page_received_at in pages:
+            for parsed in parse_page(page_messages):
+                if parsed is None:
+                    continue # Filtered out of an export (see parse_exported_message)
+                any_messages_found = True
+                emails_inspected_count += 1
+                message_id = parsed["id"]
+                log_email(f"Processing email {emails_inspected_count}: ID='{message_id}', Subject='{parsed['subject']}'")
+
+                sender_name = parsed["sender_name"]
+                sender_email = parsed["sender_email"]
+                received_dt = parsed["received_dt"]
+                received_date_iso = parsed["received_date_iso"]
+                received_date_str = parsed["received_date_str"]
+                logging.debug(f"  From: {sender_name} <{sender_email}>, Date: {received_date_str}")
+                if received_dt and (max_received_dt is None or received_dt > max_received_dt):
+                    max_received_dt = received_dt # Becomes the incremental watermark once the run is committed
+
+                if not parsed["has_body"]:
+                    logging.warning(f"Email ID {message_id} has no textual body content. Skipping.")
+                    METRICS.observe_latency(time.perf_counter() - page_received_at)
+                    continue
+
+                move_to = None # The email is moved to the folder of the first survey it changed a record of
+                for rank, answer in parsed["answers"].items():
+                    if not answer:
+                        continue
+                    survey = surveys[rank]
+                    records = pending_records[survey]
+                    sender_email_lc = sender_email.lower()
+                    new_record_data = ResponseRecord(
+                        sender_name or "",
+                        sender_email, # Store original case for CSV
+                        received_date_str, # Or received_date_iso for consistency
+                        answer,
+                        received_date_iso, # ISO format string
+                        timestamp_us(received_dt) if received_dt else OLDEST_TIMESTAMP_US, # For comparison
+                        target.rank,
+                    )
+
+                    existing_record = records.get(sender_email_lc) or survey.store.get(sender_email_lc)
+                    if existing_record:
+                        # Compare based on the timestamp of the email
+                        if received_dt and new_record_data.replaces(existing_record):
+                            log_email(f"Updating record for sender '{sender_email}' in survey '{survey.name}'. Old answer: '{existing_record.answer}' on {existing_record.last_updated}. New answer: '{answer}' on {received_date_iso} (Email ID {message_id}).")
+                            records[sender_email_lc] = new_record_data
+                            data_changed_during_scan = True
+                            emails_with_answer_count += 1 # Count as an update
+                            move_to = move_to or survey # Move email if it resulted in an update
+                        else:
+                            log_email(f"Existing record for sender '{sender_email}' in survey '{survey.name}' is more recent or same. New email (ID {message_id}) with answer '{answer}' on {received_date_iso} not processed as update.")
+                            # Optionally move this older/same-date email if it also has the target subject, even if not updating CSV
+                            # This depends on desired behavior for emails that don't change the CSV state.
+                            # For now, we only move if it *updates* the CSV record.
                     else:
-                        logging.info(f"Existing record for sender '{sender_email}' is more recent or same. New email (ID {msg.object_id}) with answer '{answer}' on {received_date_iso} not processed as update.")
-                        # Optionally move this older/same-date email if it also has the target subject, even if not updating CSV
-                        # This depends on desired behavior for emails that don't change the CSV state.
-                        # For now, we only move if it *updates* the CSV record.
+                        log_email(f"Adding new record for sender '{sender_email}' in survey '{survey.name}' with answer '{answer}' on {received_date_iso} (Email ID {message_id}).")
+                        records[sender_email_lc] = new_record_data
+                        data_changed_during_scan = True
+                        emails_with_answer_count += 1
+                        move_to = move_to or survey # Move email if it's a new record
+                if move_to is None and not any(parsed["answers"].values()):
+                    logging.debug(f"  Question or Yes/No answer not found in email ID {message_id}.")
+                if move_queue and move_to in processed_folders and message_id not in queued_move_ids:
+                    # A two-phase scan yields a message once per survey it resolves; it is moved only once
+                    log_email(f"Queueing email ID {message_id} for move to folder '{move_to.processed_folder_name}'.")
+                    move_queue.add(message_id, processed_folders[move_to])
+                    queued_move_ids.add(message_id)
+                METRICS.observe_latency(time.perf_counter() - page_received_at)
+
+            # Page done: remember where to continue if the run is interrupted from here on
+            pages_since_checkpoint += 1
+            if CHECKPOINT_EVERY_PAGES > 0 and pages_since_checkpoint >= CHECKPOINT_EVERY_PAGES:
+                if move_queue and not hold_moves:
+                    move_queue.flush() # Moves of checkpointed records must not be lost if the run stops here
+                if next_link:
+                    with METRICS.stage("checkpoint"):
+                        save_checkpoint(sync_state, query_key, next_link, max_received_dt, pending_records, state_path)
                 else:
-                    logging.info(f"Adding new record for sender '{sender_email}' with answer '{answer}' on {received_date_iso} (Email ID {msg.object_id}).")
-                    current_records[sender_email_lc] = new_record_data
-                    data_changed_during_scan = True
-                    emails_with_answer_count += 1
-                    # Move email if it's a new record
-                    if processed_folder:
-                        try:
-                            logging.info(f"Moving new record email ID {msg.object_id} to folder '{PROCESSED_FOLDER_NAME}'.")
-                            msg.move(processed_folder)
-                        except Exception as move_err:
-                            logging.error(f"Failed to move email ID {msg.object_id}: {move_err}", exc_info=False)
-            else:
-                logging.debug(f"  Question or Yes/No answer not found in email ID {msg.object_id}.")
+                    # Last page, or a two-phase batch with no page link: only save the records so far
+                    with METRICS.stage("checkpoint"):
+                        save_pending_records(pending_records)
+                pages_since_checkpoint = 0
+
+        # All pages processed. The checkpoint (with no page left) is committed by main() once the results are saved.
+        if failed_downloads:
+            max_received_dt = hold_back_watermark(max_received_dt, failed_downloads)
+            logging.warning(f"{len(failed_downloads)} body download(s) failed. The watermark is held back to {max_received_dt.isoformat()} so they are retried.")
+        if move_queue:
+            move_queue.flush()
+        with METRICS.stage("checkpoint"):
+            save_checkpoint(sync_state, query_key, None, max_received_dt, pending_records, state_path)
+        if watch:
+            promote_checkpoint(sync_state, scan_started_at) # The next poll only lists messages newer than this one's
         
         if not emails_with_answer_count and not any_messages_found: # If no emails were even found with the subject
-            logging.info(f"No emails found with subject containing: '{TARGET_SUBJECT}' in the target mailbox.")
+            log_progress(f"No emails found with subject containing: {subjects_text} in the target mailbox.")
         elif not emails_with_answer_count and any_messages_found: # Emails found, but none had answers or led to updates/new records
              logging.info(f"Processed {emails_inspected_count} email(s) with matching subject, but no new/updated answers were recorded.")
         else:
@@ -288,62 +2178,277 @@ def scan_emails():
 
     except Exception as e:
         logging.critical(f"An error occurred during email scanning: {e}", exc_info=False)
-     
-    return current_records, data_changed_during_scan
+        scan_error = str(e)
+        # Look the account and folders up again on the next scan, in case they are what failed
+        target.account = target.mailbox = None
+        target.processed_folders = {}
+
+    # Stop the pipeline stages, then send any queued moves, including those queued before a scan error
+    if pages is not None:
+        pages.close()
+    if parse_executor:
+        parse_executor.shutdown(wait=False, cancel_futures=True)
+    if move_queue:
+        if scan_error and hold_moves and move_queue.pending and (sync_state.get("checkpoint") or {}).get("next_link"):
+            # Sending the held moves shifts the listing under the checkpoint's page link, so the next
+            # run lists from the start again instead of resuming (the records are already saved)
+            logging.warning(f"Sending {len(move_queue.pending)} held move(s) after the error. The next scan of '{target.name}' lists its emails from the start.")
+            sync_state.pop("checkpoint")
+            try:
+                _write_sync_state(sync_state, state_path)
+            except Exception as state_err:
+                logging.error(f"Could not update sync state '{state_path}': {state_err}", exc_info=False)
+        try:
+            move_queue.close()
+            folder_names = ", ".join(f"'{name}'" for name in dict.fromkeys(survey.processed_folder_name for survey in processed_folders))
+            log_progress(f"Moved {move_queue.moved_count} email(s) to folder(s) {folder_names} ({move_queue.failed_count} failed).")
+        except Exception as move_err:
+            logging.error(f"Failed to send queued moves: {move_err}", exc_info=False)
+    if account and account.con.scheduler:
+        stats = account.con.scheduler.stats()
+        log_progress(f"Graph requests: {stats['requests']}, retries: {stats['retries']}, throttled responses: {stats['throttled_responses']} "
+                     f"({stats['throttled_seconds']:.1f}s paused). Concurrency limit {stats['concurrency_limit']} (lowest {stats['lowest_concurrency_limit']}).")
+    target.stats = {
+        "inspected": emails_inspected_count,
+        "recorded": emails_with_answer_count,
+        "moved": move_queue.moved_count if move_queue else 0,
+        "move_failed": move_queue.failed_count if move_queue else 0,
+        "seconds": time.perf_counter() - scan_started,
+        "error": scan_error,
+    }
+
+    return pending_records, data_changed_during_scan
 
-def save_to_csv(records_to_save, filename, data_was_changed):
+def count_target_stats(targets):
+    """Adds the counts of each target's last scan to the run metrics."""
+    for target in targets:
+        for name in ("inspected", "recorded", "moved", "move_failed"):
+            METRICS.count(f"emails_{name}", target.stats.get(name, 0))
+        METRICS.count("target_errors", 1 if target.stats.get("error") else 0)
+
+def log_target_summary(targets):
+    """Logs the time and counts of each scan target, slowest first."""
+    for target in sorted(targets, key=lambda target: target.stats.get("seconds", 0), reverse=True):
+        stats = target.stats
+        summary = (f"Target '{target.name}': {stats.get('inspected', 0)} email(s) inspected, {stats.get('recorded', 0)} answer(s) recorded, "
+                   f"{stats.get('moved', 0)} moved ({stats.get('move_failed', 0)} failed) in {stats.get('seconds', 0):.1f}s.")
+        if stats.get("error"):
+            logging.error(f"{summary} Stopped on error: {stats['error']}", exc_info=False)
+        else:
+            logging.info(summary)
+
+# --- Watch Mode ---
+class NotificationHandler(BaseHTTPRequestHandler):
+    """Receives Graph change notifications for watch mode and wakes the scan loop."""
+    def do_POST(self):
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        if "validationToken" in query:
+            # Graph checks the endpoint when the subscription is created by asking for the token back
+            self._reply(200, query["validationToken"].encode("utf-8"), "text/plain")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            notifications = json.loads(self.rfile.read(length) or b"{}").get("value", [])
+        except ValueError:
+            self._reply(400)
+            return
+        if any(notification.get("clientState") == WATCH_WEBHOOK_CLIENT_STATE for notification in notifications):
+            logging.info(f"Change notification received ({len(notifications)} change(s)). Scanning now.")
+            self.server.wake_event.set()
+        else:
+            logging.warning("Ignoring a notification with an unknown clientState.")
+        self._reply(202)
+
+    def _reply(self, status, body=b"", content_type="text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Notification receiver: {format % args}")
+
+def start_notification_receiver(wake_event):
+    """Starts the change notification receiver on WATCH_WEBHOOK_PORT, on a daemon thread."""
+    server = ThreadingHTTPServer(("", WATCH_WEBHOOK_PORT), NotificationHandler)
+    server.wake_event = wake_event
+    threading.Thread(target=server.serve_forever, name="notification-receiver", daemon=True).start()
+    logging.info(f"Listening for Graph change notifications on port {WATCH_WEBHOOK_PORT} (public URL: {WATCH_WEBHOOK_URL}).")
+    return server
+
+def renew_subscriptions(targets, subscriptions):
     """
-    Saves the records to a CSV file.
-    If data_was_changed is True and the file exists, it backs up the old file.
+    Creates a Graph change notification subscription for new messages of each connected target,
+    and renews it once less than a day is left. subscriptions maps target names to
+    {"id", "account", "expires"} and is updated in place.
     """
-    if not records_to_save:
-        logging.info("No records to save to CSV.")
-        return
+    now = datetime.now(timezone.utc)
+    for target in targets:
+        subscription = subscriptions.get(target.name)
+        if target.account is None or (subscription and subscription["expires"] - now > timedelta(days=1)):
+            continue
+        expires = now + timedelta(minutes=WEBHOOK_SUBSCRIPTION_MINUTES)
+        subscriptions_url = f"{target.account.protocol.service_url}subscriptions"
+        try:
+            if subscription:
+                target.account.con.patch(f"{subscriptions_url}/{subscription['id']}",
+                                         data={"expirationDateTime": expires.strftime('%Y-%m-%dT%H:%M:%SZ')})
+                logging.info(f"Renewed change notification subscription for '{target.name}'.")
+            else:
+                if target.mailbox is None or target.mailbox.root:
+                    resource = f"users/{target.mailbox_address}/messages"
+                else:
+                    resource = f"users/{target.mailbox_address}/mailFolders('{target.mailbox.folder_id}')/messages"
+                response = target.account.con.post(subscriptions_url, data={
+                    "changeType": "created",
+                    "notificationUrl": WATCH_WEBHOOK_URL,
+                    "resource": resource,
+                    "expirationDateTime": expires.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    "clientState": WATCH_WEBHOOK_CLIENT_STATE,
+                })
+                subscription = {"id": response.json()["id"], "account": target.account}
+                logging.info(f"Subscribed to change notifications for '{target.name}'.")
+            subscription["expires"] = expires
+            subscriptions[target.name] = subscription
+        except Exception as e:
+            # Polling still picks up new replies; the subscription is created again on the next poll
+            logging.error(f"Could not subscribe to change notifications for '{target.name}': {e}", exc_info=False)
+            subscriptions.pop(target.name, None)
+
+def delete_subscriptions(subscriptions):
+    for name, subscription in subscriptions.items():
+        try:
+            subscription["account"].con.delete(f"{subscription['account'].protocol.service_url}subscriptions/{subscription['id']}")
+        except Exception as e:
+            logging.warning(f"Could not delete change notification subscription for '{name}': {e}")
+    subscriptions.clear()
+
+def flush_watch_state(targets):
+    """Writes the sync state of each target to its file, the CSV of each survey whose answers changed, and the run summary (counted since the watch started)."""
+    for target in targets:
+        if target.sync_state is not None and target.state_path:
+            try:
+                _write_sync_state(target.sync_state, target.state_path)
+            except Exception as e:
+                logging.error(f"Could not save sync state to '{target.state_path}': {e}", exc_info=False)
+    for survey in SURVEY_RULES.surveys:
+        if CSV_EXPORT != "never" and survey.store.export_pending():
+            export_csv(survey.store, survey.csv_path)
+    write_run_summary(targets, success=not any(target.stats.get("error") for target in targets))
+
+def watch(targets):
+    """
+    Watch mode: keeps the account and folders of each target and scans for new replies every
+    WATCH_POLL_SECONDS, or as soon as Graph notifies the webhook receiver. Each poll only lists
+    messages received since the previous one. Records are saved to the store after every poll;
+    the sync state files and the CSV are written every WATCH_FLUSH_SECONDS and when the watch
+    stops (Ctrl+C or SIGTERM).
+    """
+    stop_event = threading.Event()
+    wake_event = threading.Event()
+
+    def request_stop(signum, frame):
+        logging.info("Stop requested. Finishing the current poll...")
+        stop_event.set()
+        wake_event.set()
 
+    signal.signal(signal.SIGTERM, request_stop)
+    receiver = None
+    if WATCH_WEBHOOK_PORT:
+        if WATCH_WEBHOOK_URL:
+            receiver = start_notification_receiver(wake_event)
+        else:
+            logging.warning("WATCH_WEBHOOK_PORT is set but WATCH_WEBHOOK_URL is not. Change notifications are disabled.")
+    subscriptions = {}
+    executor = ThreadPoolExecutor(max_workers=min(SCAN_TARGET_WORKERS, len(targets)), thread_name_prefix="target") if len(targets) > 1 else None
+    scan_target = partial(scan_emails, watch=True)
+    last_flush = time.monotonic()
+    logging.info(f"Watching {', '.join(target.name for target in targets)} for new replies every {WATCH_POLL_SECONDS}s. Press Ctrl+C to stop.")
+    try:
+        while not stop_event.is_set():
+            wake_event.clear() # A notification arriving during the poll triggers another one right after it
+            results = list(executor.map(scan_target, targets)) if executor else [scan_target(targets[0])]
+            count_target_stats(targets)
+            for target, (unsaved_records, data_changed) in zip(targets, results):
+                # Only left over when the poll stopped on an error; the next poll resumes from its checkpoint
+                with METRICS.stage("store"):
+                    save_pending_records(unsaved_records)
+                if data_changed:
+                    logging.info(f"Target '{target.name}': {target.stats.get('recorded', 0)} new or updated answer(s) recorded.")
+            if receiver:
+                renew_subscriptions(targets, subscriptions)
+            if time.monotonic() - last_flush >= WATCH_FLUSH_SECONDS:
+                flush_watch_state(targets)
+                last_flush = time.monotonic()
+            wake_event.wait(WATCH_POLL_SECONDS)
+    except KeyboardInterrupt:
+        logging.info("Watch mode interrupted.")
+    finally:
+        if executor:
+            executor.shutdown()
+        if subscriptions:
+            delete_subscriptions(subscriptions)
+        if receiver:
+            receiver.shutdown()
+        flush_watch_state(targets)
+        logging.info("Watch mode stopped. State saved.")
+
+def export_csv(store, filename):
+    """
+    Exports the response store to the CSV file.
+    Returns False if the file could not be written, True otherwise.
+    """
     if not filename:
         logging.error("Output CSV filepath is not configured. Cannot save CSV.")
-        return
-
-    if not data_was_changed and os.path.exists(filename): # filename is now OUTPUT_CSV_FILE_PATH
-        logging.info(f"No changes detected in data. CSV file '{filename}' will not be modified.")
-        return
+        return False
 
-    # Backup existing file if it exists and data has changed
-    if os.path.exists(filename) and data_was_changed:
-        try:
-            backup_filename = f"{os.path.splitext(filename)[0]}{datetime.now().strftime(CSV_BACKUP_TIMESTAMP_FORMAT)}{os.path.splitext(filename)[1]}"
-            os.rename(filename, backup_filename)
-            logging.info(f"Backed up existing CSV file to '{backup_filename}'.")
-        except Exception as backup_err:
-            logging.error(f"Could not back up existing CSV file '{filename}'. Error: {backup_err}", exc_info=False)
-            # Decide if you want to proceed with overwrite or stop. For now, we'll proceed.
-
-    logging.info(f"Saving {len(records_to_save)} records to {filename}...")
+    logging.info(f"Exporting {store.count()} records to {filename}...")
     try:
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            # "Date Received" now reflects the date of the email that provided the latest answer.
-            # "Last Updated" is the timestamp of that latest email in ISO format.
-            fieldnames = ["Sender Name", "Sender Email", "Date Received", "Answer", "Last Updated"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            # Sort by sender email for consistent output, optional
-            for record_key in sorted(records_to_save.keys()):
-                record = records_to_save[record_key]
-                # Prepare row for CSV, ensuring only defined fieldnames are written
-                row_to_write = {field: record.get(field, "") for field in fieldnames}
-                writer.writerow(row_to_write)
+        # "Date Received" reflects the date of the email that provided the latest answer.
+        # "Last Updated" is the timestamp of that latest email in ISO format.
+        with METRICS.stage("csv_export"):
+            store.export_csv(filename)
         logging.info(f"Data successfully saved to {filename}")
+        return True
     except IOError as e:
         logging.critical(f"Error writing to CSV file {filename}: {e}", exc_info=False)
     except Exception as e:
         logging.critical(f"An unexpected error occurred while saving CSV: {e}", exc_info=False)
-def main():
+    return False
+
+def main(argv=None):
     """
     Main function to orchestrate the email scanning and data saving process.
+    With --profile the whole run is profiled.
     """
+    parser = argparse.ArgumentParser(description="Scans a mailbox for survey replies and records the answers.")
+    parser.add_argument("--export-csv", action="store_true", help="only export the response store to the output CSV, without scanning")
+    parser.add_argument("--watch", action="store_true", help="keep running and process new replies as they arrive (see WATCH_* settings)")
+    parser.add_argument("--from-export", metavar="PATH",
+                        help="read the replies from a mailbox export (an mbox file or a directory of .eml files) instead of Microsoft Graph")
+    parser.add_argument("--profile", choices=("cpu", "memory"),
+                        help="profile the run with cProfile (cpu) or tracemalloc (memory) and write the report next to the output CSV")
+    args = parser.parse_args(argv)
+    with profiling(args.profile):
+        run(args)
+
+def run(args):
+    """Runs the scan, watch or export selected by the command line arguments."""
     logging.info("======================================================================")
     logging.info("                       SCRIPT RUN STARTED                             ")
     logging.info("======================================================================")
+    surveys = SURVEY_RULES.surveys
+    if args.export_csv:
+        if not surveys or not all(survey.csv_path for survey in surveys):
+            logging.critical("OUTPUT_CSV_FILE is not defined in .env (or SURVEYS_FILE defines no survey). Cannot export results.")
+            return
+        open_response_stores(surveys)
+        for survey in surveys:
+            export_csv(survey.store, survey.csv_path)
+        close_response_stores(surveys)
+        return
+
     required_env_vars_map = {
         "EMAIL_ADDRESS": EMAIL_ADDRESS, "TENANT_ID": TENANT_ID,
         "CLIENT_ID": CLIENT_ID, "CLIENT_SECRET": CLIENT_SECRET,
@@ -352,6 +2457,16 @@ def main():
         "OUTPUT_CSV_FILE": OUTPUT_CSV_FILENAME # Check for the filename, path is constructed
     }
     
+    if SCAN_TARGETS:
+        del required_env_vars_map["EMAIL_ADDRESS"] # The mailboxes come from SCAN_TARGETS
+    if SURVEYS_FILE:
+        # Each survey in the rules file has its own subject, question, CSV and processed folder
+        for name in ("TARGET_SUBJECT", "SEARCH_QUESTION", "PROCESSED_FOLDER_NAME", "OUTPUT_CSV_FILE"):
+            del required_env_vars_map[name]
+    if args.from_export:
+        # No Graph connection, and nothing is moved
+        for name in ("EMAIL_ADDRESS", "TENANT_ID", "CLIENT_ID", "CLIENT_SECRET", "PROCESSED_FOLDER_NAME"):
+            required_env_vars_map.pop(name, None)
     missing_vars = [name for name, value in required_env_vars_map.items() if not value]
     
     if missing_vars:
@@ -359,17 +2474,76 @@ def main():
         logging.critical("Please ensure all required variables are set.")
         logging.critical("For Microsoft Graph API (using O365 library), ensure your Azure AD app registration has the necessary permissions (e.g., Mail.Read and Mail.ReadWrite for Application if moving emails) and admin consent.")
         return
+    if not surveys:
+        logging.critical(f"No survey to scan: the rules file '{SURVEYS_FILE}' could not be loaded or defines no surveys.")
+        return
+    if len(surveys) > 1:
+        logging.info(f"Scanning for {len(surveys)} surveys in one pass: {', '.join(survey.name for survey in surveys)}")
 
-    logging.info("Starting email scan script using O365 library for Microsoft Graph API...")
-    final_records, data_changed = scan_emails()
-    
-    if OUTPUT_CSV_FILE_PATH: # Ensure path is configured before trying to save
-        if final_records or data_changed: # Save if there are records or if data changed (e.g. all records removed)
-            save_to_csv(final_records, OUTPUT_CSV_FILE_PATH, data_changed)
-        else:
-            logging.info("No records to process or save after scanning, and no data changes detected.")
+    try:
+        open_response_stores(surveys)
+    except Exception as e:
+        logging.critical(f"Could not open response store: {e}", exc_info=False)
+        return
+
+    run_started_at = datetime.now(timezone.utc)
+    source = None
+    if args.from_export:
+        try:
+            source = ExportSource(args.from_export)
+        except FileNotFoundError as e:
+            logging.critical(str(e))
+            close_response_stores(surveys)
+            return
+        if args.watch:
+            logging.warning("--watch does not apply to a mailbox export. Reading the export once.")
+        logging.info(f"Starting email scan of mailbox export '{args.from_export}' with {OFFLINE_WORKERS} worker process(es)...")
+        target = ScanTarget(args.from_export)
+        target.state_path = None # An export is always read whole, so there is no watermark to keep
+        targets = [target]
     else:
-        logging.error("OUTPUT_CSV_FILE is not defined in .env. Cannot save results.")
+        logging.info("Starting email scan script using O365 library for Microsoft Graph API...")
+        targets = get_scan_targets()
+        if args.watch:
+            watch(targets)
+            close_response_stores(surveys)
+            logging.info("Script finished.")
+            return
+    if source is not None:
+        results = [scan_emails(targets[0], source=source)]
+    elif len(targets) == 1:
+        results = [scan_emails(targets[0])]
+    else:
+        # Each target has its own Account, sync state and request scheduler, so a slow or throttled
+        # mailbox does not hold up the others
+        logging.info(f"Scanning {len(targets)} targets, up to {SCAN_TARGET_WORKERS} in parallel: {', '.join(target.name for target in targets)}")
+        with ThreadPoolExecutor(max_workers=min(SCAN_TARGET_WORKERS, len(targets)), thread_name_prefix="target") as executor:
+            results = list(executor.map(scan_emails, targets))
+    data_changed = any(target_changed for _, target_changed in results)
+
+    saved = True
+    try:
+        for target, (unsaved_records, _) in zip(targets, results):
+            # Records changed after the target's last checkpoint (e.g. when the scan stopped on an error),
+            # merged in SCAN_TARGETS order; the store keeps the newest answer per sender
+            with METRICS.stage("store"):
+                save_pending_records(unsaved_records)
+            # Advances the incremental watermark only if the scan ran to the last page
+            commit_sync_state(run_started_at, target.state_path)
+    except Exception as e:
+        logging.critical(f"Could not save records to response store: {e}", exc_info=False)
+        saved = False
+
+    if len(targets) > 1:
+        log_target_summary(targets)
+    if not data_changed:
+        logging.info("No new or updated answers were recorded by this scan.")
+    for survey in surveys:
+        if CSV_EXPORT != "never" and (survey.store.export_pending() or (survey.store.count() and not os.path.exists(survey.csv_path))):
+            export_csv(survey.store, survey.csv_path)
+    close_response_stores(surveys)
+    count_target_stats(targets)
+    write_run_summary(targets, success=saved and not any(target.stats.get("error") for target in targets))
     
     logging.info("----------------------------------------------------------------------")
     logging.info("Script finished.")
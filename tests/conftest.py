@@ -0,0 +1,16 @@
+"""
+Imports email_scanner from a scratch directory: importing it creates logs/ and output/ in the
+working directory.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="email_scanner_tests_"))
+try:
+    import email_scanner  # noqa: F401
+finally:
+    os.chdir(_cwd)
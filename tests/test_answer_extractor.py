@@ -0,0 +1,91 @@
+import re
+
+import pytest
+
+from email_scanner import AnswerExtractor
+
+QUESTION = "Do you still need the use of this mobile phone?"
+FIRST_CHUNK = AnswerExtractor.FIRST_CHUNK_CHARS
+
+
+def reference_extract(text, question=QUESTION, window_chars=100):
+    """The answer a whole-text search gives, without chunking: the first Yes/No after the first question."""
+    lowered = text.lower()
+    start = lowered.find(question.lower())
+    if start < 0:
+        return None
+    window_start = start + len(question)
+    match = re.compile(r"\b(?:(yes)|(no))\b").search(lowered, window_start, window_start + window_chars)
+    if not match:
+        return None
+    return "Yes" if match.group(1) else "No"
+
+
+@pytest.fixture
+def extractor():
+    return AnswerExtractor([QUESTION])
+
+
+@pytest.mark.parametrize("text, expected", [
+    (f"{QUESTION} Yes", "Yes"),
+    (f"{QUESTION} no, it can be collected", "No"),
+    (f"{QUESTION.upper()} YES - please keep it", "Yes"),
+    (f"{QUESTION} yesterday I was out. No.", "No"), # "yes" inside a word is not an answer
+    (f"{QUESTION} Not sure yet", None),
+    (f"{QUESTION} {'x' * 120} Yes", None), # Past the answer window
+    ("Yes, I still need it.", None), # No question
+    ("", None),
+])
+def test_extract(extractor, text, expected):
+    assert extractor.extract(text) == expected
+
+
+def test_line_breaks_inside_the_question_are_tolerated(extractor):
+    assert extractor.extract("Do you still need the use of\r\n  this mobile phone? No") == "No"
+
+
+def test_only_the_first_question_counts(extractor):
+    assert extractor.extract(f"{QUESTION} Maybe later.{' ' * 120}{QUESTION} Yes") is None
+
+
+def test_variants_and_custom_phrases():
+    extractor = AnswerExtractor([QUESTION, "Do you still need the phone?"],
+                                yes_phrases=["yes", "still need it"], no_phrases=["no", "no longer need it"])
+    assert extractor.extract("Do you still need the phone? I still need it") == "Yes"
+    assert extractor.extract(f"{QUESTION} I no longer need it") == "No"
+
+
+def test_needs_a_question():
+    with pytest.raises(ValueError):
+        AnswerExtractor(["", "  "])
+
+
+@pytest.mark.parametrize("offset", range(FIRST_CHUNK - len(QUESTION) - 8, FIRST_CHUNK + 8))
+def test_question_across_the_first_chunk_boundary(extractor, offset):
+    text = "x " * (offset // 2) + " " * (offset % 2) + f"{QUESTION}   No thanks" + " filler" * 50
+    assert extractor.extract(text) == reference_extract(text) == "No"
+
+
+@pytest.mark.parametrize("offset", [FIRST_CHUNK - 20, FIRST_CHUNK - 2, FIRST_CHUNK + 1])
+def test_answer_across_the_first_chunk_boundary(extractor, offset):
+    # The question ends just before the boundary and the answer starts after it
+    text = " " * (offset - len(QUESTION)) + QUESTION + " " * 30 + "Yes" + " filler" * 50
+    assert extractor.extract(text) == reference_extract(text) == "Yes"
+
+
+@pytest.mark.parametrize("offset", [AnswerExtractor.MAX_CHUNK_CHARS * 3 + 17, 250_000])
+def test_question_deep_in_a_long_body(extractor, offset):
+    text = "quoted history\n" * (offset // 15) + f"{QUESTION} yes" + "\n> more" * 10
+    assert extractor.extract(text) == reference_extract(text) == "Yes"
+
+
+
+@pytest.mark.parametrize("text, expected", [
+    (f"{QUESTION} No", None), # May be the start of "Not sure"
+    (f"{QUESTION} yes", None), # May be the start of "yesterday"
+    (f"{QUESTION} No ", "No"),
+    (f"{QUESTION} No, keep it", "No"),
+    (f"{QUESTION} maybe", None),
+])
+def test_cut_text(extractor, text, expected):
+    assert extractor.extract(text, complete=False) == expected
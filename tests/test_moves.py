@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+import email_scanner
+from email_scanner import MoveQueue
+
+
+class FakeMailbox:
+    _endpoints = {"message": "/messages/{id}"}
+    protocol = SimpleNamespace(service_url="https://graph.test/v1.0/")
+
+    def build_url(self, endpoint):
+        return "https://graph.test/v1.0/users/surveys@example.gov" + endpoint
+
+
+@pytest.fixture
+def sent_batches(monkeypatch):
+    batches = []
+
+    def send_graph_batch(mailbox, requests, max_retries, description="request"):
+        batches.append(requests)
+        return [{"status": 404 if request["url"].endswith("/gone/move") else 201} for request in requests]
+
+    monkeypatch.setattr(email_scanner, "send_graph_batch", send_graph_batch)
+    monkeypatch.setattr(email_scanner, "MOVE_BATCH_SIZE", 20)
+    return batches
+
+
+def folder(folder_id, name):
+    return SimpleNamespace(folder_id=folder_id, name=name)
+
+
+def test_moves_are_sent_as_soon_as_a_batch_is_full(sent_batches):
+    move_queue = MoveQueue(FakeMailbox())
+    for index in range(25):
+        move_queue.add(f"msg{index}", folder("f1", "Processed"))
+    assert [len(batch) for batch in sent_batches] == [20]
+    move_queue.close()
+    assert [len(batch) for batch in sent_batches] == [20, 5]
+    assert move_queue.moved_count == 25
+
+
+def test_held_moves_wait_for_flush(sent_batches):
+    move_queue = MoveQueue(FakeMailbox(), hold=True)
+    for index in range(45):
+        move_queue.add(f"msg{index}", folder("f1" if index % 2 else "f2", "Processed"))
+    assert sent_batches == []
+    assert len(move_queue.pending) == 45
+    move_queue.flush()
+    assert [len(batch) for batch in sent_batches] == [20, 20, 5]
+    assert move_queue.pending == []
+    assert move_queue.moved_count == 45
+
+
+def test_each_move_has_its_own_destination(sent_batches):
+    move_queue = MoveQueue(FakeMailbox(), hold=True)
+    move_queue.add("msg1", folder("phones", "ProcessedPhones"))
+    move_queue.add("msg2", folder("hotspots", "ProcessedHotspots"))
+    move_queue.add("gone", "phones")
+    move_queue.close()
+    (batch,) = sent_batches
+    assert [(request["url"], request["body"]["destinationId"]) for request in batch] == [
+        ("/users/surveys@example.gov/messages/msg1/move", "phones"),
+        ("/users/surveys@example.gov/messages/msg2/move", "hotspots"),
+        ("/users/surveys@example.gov/messages/gone/move", "phones"),
+    ]
+    assert (move_queue.moved_count, move_queue.failed_count) == (2, 1)
@@ -0,0 +1,59 @@
+import pytest
+
+import email_scanner
+from email_scanner import SEARCH_RESULT_LIMIT, iter_search_pages
+
+SEARCH = {"$search": '"subject:Survey"', "$top": 500}
+FILTER = {"$filter": "contains(subject, 'Survey')", "$top": 500}
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """Fakes iter_message_pages: a $search returns `found` messages in pages of 500, a $filter returns 3."""
+    calls = []
+    found = {"search": 0}
+
+    def iter_message_pages(mailbox, params, next_link=None, raw=False, keep=None):
+        calls.append(("search" if "$search" in params else "filter", next_link))
+        skip = int(next_link.rsplit("=", 1)[1]) if next_link and "$search" in params else 0
+        total = found["search"] if "$search" in params else 3
+        for start in range(skip, total, 500):
+            page = [{"id": f"m{index}"} for index in range(start, min(start + 500, total))]
+            yield [message for message in page if keep is None or keep(message)], None
+
+    monkeypatch.setattr(email_scanner, "iter_message_pages", iter_message_pages)
+    return calls, found
+
+
+def listed_ids(pages):
+    return [message["id"] for page, _ in pages for message in page]
+
+
+def test_search_below_the_limit_is_not_repeated(listings):
+    calls, found = listings
+    found["search"] = SEARCH_RESULT_LIMIT - 1
+    assert len(listed_ids(iter_search_pages(None, SEARCH, FILTER))) == SEARCH_RESULT_LIMIT - 1
+    assert calls == [("search", None)]
+
+
+def test_search_at_the_limit_falls_back_to_the_filter(listings):
+    calls, found = listings
+    found["search"] = SEARCH_RESULT_LIMIT
+    ids = listed_ids(iter_search_pages(None, SEARCH, FILTER, keep=lambda message: message["id"] != "m0"))
+    assert len(ids) == (SEARCH_RESULT_LIMIT - 1) + 2 # keep applies to both listings, and still counts what it drops
+    assert calls == [("search", None), ("filter", None)]
+
+
+def test_resumed_search_counts_the_skipped_results(listings):
+    calls, found = listings
+    found["search"] = SEARCH_RESULT_LIMIT
+    link = "https://graph.test/v1.0/users/x/messages?$search=%22subject%3ASurvey%22&$top=500&$skip=500"
+    listed_ids(iter_search_pages(None, SEARCH, FILTER, next_link=link))
+    assert calls == [("search", link), ("filter", None)]
+
+
+def test_resumed_filter_part_continues_the_filter(listings):
+    calls, _ = listings
+    link = "https://graph.test/v1.0/users/x/messages?$filter=contains(subject,'Survey')&$top=500&$skip=500"
+    listed_ids(iter_search_pages(None, SEARCH, FILTER, next_link=link))
+    assert calls == [("filter", link)]
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import email_scanner
+from email_scanner import AnswerExtractor, Survey, SurveyRules, load_survey_rules
+
+
+def make_rules(*subjects):
+    return SurveyRules([Survey(f"survey{rank}", subject, AnswerExtractor(["Question?"]), f"survey{rank}.csv",
+                               f"survey{rank}.sqlite3", rank=rank) for rank, subject in enumerate(subjects)])
+
+
+def matched_names(rules, subject):
+    return [survey.name for survey in rules.match_subject(subject)]
+
+
+@pytest.mark.parametrize("subject, expected", [
+    ("RE: Device Survey", ["survey0"]),
+    ("RE: Device Return Survey", ["survey0", "survey1"]), # One subject contains the other
+    ("re: DEVICE RETURN", ["survey0", "survey1"]),
+    ("Fwd: Hotspot (2025) [action needed]", ["survey2"]),
+    ("Device Return and Hotspot (2025) [action needed]", ["survey0", "survey1", "survey2"]),
+    ("Team lunch on Friday", []),
+    ("", []),
+    (None, []),
+])
+def test_match_subject(subject, expected):
+    rules = make_rules("Device", "Device Return", "Hotspot (2025) [action needed]")
+    assert matched_names(rules, subject) == expected
+
+
+def test_match_subject_matches_graph_contains_across_lines():
+    rules = make_rules("Device Return")
+    assert matched_names(rules, "Automatic reply:\nDevice Return") == ["survey0"]
+
+
+def test_subjects_and_questions_are_distinct():
+    rules = SurveyRules([
+        Survey("a", "Device", AnswerExtractor(["Keep it?", "Still need it?"]), "a.csv", "a.sqlite3"),
+        Survey("b", "Device", AnswerExtractor(["Keep it?"]), "b.csv", "b.sqlite3", rank=1),
+    ])
+    assert rules.subjects() == ["Device"]
+    assert rules.questions() == ["Keep it?", "Still need it?"]
+
+
+def write_rules(tmp_path, surveys):
+    path = tmp_path / "surveys.json"
+    path.write_text(json.dumps({"surveys": surveys}), encoding="utf-8")
+    return str(path)
+
+
+def test_load_survey_rules(tmp_path):
+    rules = load_survey_rules(write_rules(tmp_path, [
+        {"name": "Phones", "subject": "Mobile Phone Usage Query", "question": "Do you still need this phone?",
+         "output_csv": "phones.csv", "processed_folder": "ProcessedPhones"},
+        {"name": "Hotspot Need", "subject": "Hotspot", "question": "Do you still need your hotspot?",
+         "question_variants": ["Do you still need the hotspot?"], "yes_phrases": ["still need it"], "no_phrases": ["return it"]},
+    ]))
+    phones, hotspots = rules.surveys
+    assert (phones.name, phones.rank, phones.processed_folder_name) == ("Phones", 0, "ProcessedPhones")
+    assert phones.csv_path.endswith("phones.csv") and phones.state_db_path.endswith("phones.sqlite3")
+    assert hotspots.rank == 1 and hotspots.processed_folder_name is None
+    assert hotspots.csv_path.endswith("hotspot_need.csv")
+    assert hotspots.extractor.extract("Do you still need the hotspot? I still need it") == "Yes"
+    assert hotspots.extractor.extract("Do you still need your hotspot? I will return it") == "No"
+
+
+@pytest.mark.parametrize("surveys", [
+    [{"name": "a", "subject": "A", "question": "Q?"}, {"name": "a", "subject": "B", "question": "Q?"}],
+    [{"name": "a", "subject": "A", "question": "Q?", "output_csv": "same.csv"},
+     {"name": "b", "subject": "B", "question": "Q?", "output_csv": "same.csv"}],
+    [{"name": "a", "subject": "A"}],
+])
+def test_invalid_rules_give_no_surveys(tmp_path, surveys):
+    assert load_survey_rules(write_rules(tmp_path, surveys)).surveys == []
+
+
+def test_missing_rules_file_gives_no_surveys(tmp_path):
+    assert load_survey_rules(str(tmp_path / "missing.json")).surveys == []
+
+
+def test_save_pending_records_writes_each_survey_store(tmp_path):
+    rules = make_rules("Device", "Hotspot")
+    for survey in rules.surveys:
+        survey.state_db_path = str(tmp_path / survey.state_db_path)
+        survey.store = email_scanner.ResponseStore(survey.state_db_path)
+    record = email_scanner.ResponseRecord("User 1", "User1@example.gov", "2025-05-01 10:00:00 UTC", "Yes",
+                                          "2025-05-01T10:00:00+00:00", 1746093600000000)
+    pending = {rules.surveys[0]: {"user1@example.gov": record}, rules.surveys[1]: {}}
+    try:
+        assert email_scanner.save_pending_records(pending) == 1
+        assert pending == {rules.surveys[0]: {}, rules.surveys[1]: {}}
+        assert rules.surveys[0].store.get("user1@example.gov").answer == "Yes"
+        assert rules.surveys[1].store.get("user1@example.gov") is None
+    finally:
+        email_scanner.close_response_stores(rules.surveys)
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+from email_scanner import hold_back_watermark, promote_checkpoint
+
+RUN_STARTED = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def checkpoint(next_link=None, max_received="2025-05-31T08:00:00+00:00", saved_at=RUN_STARTED + timedelta(minutes=5), surveys=None):
+    return {"query": "contains(subject, 'Survey')", "next_link": next_link, "max_received": max_received,
+            "saved_at": saved_at.isoformat(), "surveys": surveys}
+
+
+def test_promote_sets_the_watermark_and_clears_the_checkpoint():
+    state = {"watermark": "2025-05-01T00:00:00+00:00", "checkpoint": checkpoint(surveys=["phones", "hotspots"])}
+    assert promote_checkpoint(state, RUN_STARTED)
+    assert state["watermark"] == "2025-05-31T08:00:00+00:00"
+    assert state["surveys"] == ["phones", "hotspots"]
+    assert "checkpoint" not in state
+    assert "last_successful_run" in state
+
+
+def test_promote_never_moves_the_watermark_back():
+    state = {"watermark": "2025-06-01T00:00:00+00:00", "checkpoint": checkpoint()}
+    assert promote_checkpoint(state, RUN_STARTED)
+    assert state["watermark"] == "2025-06-01T00:00:00+00:00"
+
+
+def test_promote_without_new_mail_keeps_the_watermark():
+    state = {"watermark": "2025-05-01T00:00:00+00:00", "checkpoint": checkpoint(max_received=None)}
+    assert promote_checkpoint(state, RUN_STARTED)
+    assert state["watermark"] == "2025-05-01T00:00:00+00:00"
+
+
+def test_no_promotion_while_pages_are_left():
+    state = {"watermark": "2025-05-01T00:00:00+00:00", "checkpoint": checkpoint(next_link="https://graph.test/next")}
+    assert not promote_checkpoint(state, RUN_STARTED)
+    assert state["watermark"] == "2025-05-01T00:00:00+00:00"
+    assert "checkpoint" in state
+
+
+def test_no_promotion_of_a_checkpoint_from_an_earlier_run():
+    state = {"checkpoint": checkpoint(saved_at=RUN_STARTED - timedelta(hours=1))}
+    assert not promote_checkpoint(state, RUN_STARTED)
+    assert "watermark" not in state
+
+
+def test_no_promotion_without_a_checkpoint():
+    state = {"watermark": "2025-05-01T00:00:00+00:00"}
+    assert not promote_checkpoint(state, RUN_STARTED)
+    assert state == {"watermark": "2025-05-01T00:00:00+00:00"}
+
+
+def test_hold_back_below_the_oldest_failed_download():
+    newest = datetime(2025, 6, 30, tzinfo=timezone.utc)
+    failed = [{"receivedDateTime": "2025-06-20T10:00:00Z"}, {"receivedDateTime": "2025-06-10T10:00:00Z"}]
+    held = hold_back_watermark(newest, failed)
+    assert held == datetime(2025, 6, 10, 10, 0, tzinfo=timezone.utc) - timedelta(microseconds=1)
+    # The next incremental listing starts at or before the failed reply again
+    state = {"checkpoint": checkpoint(max_received=held.isoformat())}
+    assert promote_checkpoint(state, RUN_STARTED)
+    assert datetime.fromisoformat(state["watermark"]) < datetime(2025, 6, 10, 10, 0, tzinfo=timezone.utc)
+
+
+def test_hold_back_without_failures_or_listing():
+    newest = datetime(2025, 6, 30, tzinfo=timezone.utc)
+    assert hold_back_watermark(newest, []) == newest
+    assert hold_back_watermark(None, [{"receivedDateTime": "2025-06-10T10:00:00Z"}]) is None
+    assert hold_back_watermark(newest, [{"receivedDateTime": "2025-07-01T00:00:00Z"}]) == newest
@@ -0,0 +1,97 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import email_scanner
+from email_scanner import AnswerExtractor, Survey, SurveyRules
+
+
+class FakeMessage:
+    """The parts of an O365 Message that parse_message reads."""
+    def __init__(self, data):
+        self.object_id = data["id"]
+        self.subject = data["subject"]
+        self.body = data["body"]["content"]
+        self.received = datetime.fromisoformat(data["receivedDateTime"].replace("Z", "+00:00"))
+        address = data["from"]["emailAddress"]
+        self.sender = SimpleNamespace(name=address["name"], address=address["address"])
+
+
+class FakeMailbox:
+    _cloud_data_key = "__cloud_data__"
+    _endpoints = {"message": "/messages/{id}"}
+    protocol = SimpleNamespace(service_url="https://graph.test/v1.0/")
+
+    def build_url(self, endpoint):
+        return "https://graph.test/v1.0/users/surveys@example.gov" + endpoint
+
+    def message_constructor(self, parent, download_attachments, **kwargs):
+        return FakeMessage(kwargs[self._cloud_data_key])
+
+
+def make_survey(name, subject, question, rank):
+    return Survey(name, subject, AnswerExtractor([question]), f"{name}.csv", f"{name}.sqlite3", rank=rank)
+
+
+def run_two_phase(monkeypatch, surveys, message, full_body):
+    """Runs phase two for one message listed for every survey, and parses what it yields."""
+    monkeypatch.setattr(email_scanner, "SURVEY_RULES", SurveyRules(surveys))
+    monkeypatch.setattr(email_scanner, "BODY_PREVIEW_FIRST", True)
+    monkeypatch.setattr(email_scanner, "TWO_PHASE_BODY_FIELDS", ["body"])
+    monkeypatch.setattr(email_scanner, "send_graph_batch", lambda mailbox, requests, max_retries, description="request": [
+        {"status": 200, "body": {"body": {"contentType": "text", "content": full_body}}} for _ in requests])
+    candidates = {(survey, "user1@example.gov"): [message] for survey in surveys}
+    pages = email_scanner.iter_two_phase_pages(FakeMailbox(), candidates)
+    return [email_scanner.parse_message(msg) for messages, _ in pages for msg in messages]
+
+
+def test_cut_preview_is_not_read_as_an_answer_for_another_survey(monkeypatch):
+    device = make_survey("device", "Device", "Do you still need this device?", 0)
+    device_return = make_survey("device_return", "Device Return", "Have you returned the old device?", 1)
+    head = "Have you returned the old device? Yes, last week.\n"
+    tail = "Do you still need this device? Not sure yet, I will ask my manager."
+    # The preview is cut right after the "No" of "Not sure"
+    full_body = head + " " * (email_scanner.BODY_PREVIEW_CHARS - len(head) - len("Do you still need this device? No")) + tail
+    preview = full_body[:email_scanner.BODY_PREVIEW_CHARS]
+    assert preview.endswith("device? No")
+    assert device.extractor.extract(full_body) is None
+    message = {
+        "id": "AAMk1", "subject": "RE: Device Return", "receivedDateTime": "2025-05-01T10:00:00Z",
+        "from": {"emailAddress": {"name": "User 1", "address": "user1@example.gov"}}, "bodyPreview": preview,
+    }
+
+    parsed = run_two_phase(monkeypatch, [device, device_return], message, full_body)
+
+    assert parsed
+    assert all(result["answers"].get(device.rank) is None for result in parsed)
+    assert any(result["answers"].get(device_return.rank) == "Yes" for result in parsed)
+
+
+def test_failed_body_download_is_reported(monkeypatch):
+    survey = make_survey("phones", "Phone Survey", "Do you still need this phone?", 0)
+    monkeypatch.setattr(email_scanner, "SURVEY_RULES", SurveyRules([survey]))
+    monkeypatch.setattr(email_scanner, "BODY_PREVIEW_FIRST", True)
+    monkeypatch.setattr(email_scanner, "TWO_PHASE_BODY_FIELDS", ["body"])
+    monkeypatch.setattr(email_scanner, "send_graph_batch",
+                        lambda mailbox, requests, max_retries, description="request": [{"status": 500} for _ in requests])
+    newer = {"id": "AAMk2", "subject": "RE: Phone Survey", "receivedDateTime": "2025-05-02T10:00:00Z",
+             "from": {"emailAddress": {"name": "User 1", "address": "user1@example.gov"}}, "bodyPreview": "Thanks!"}
+    older = dict(newer, id="AAMk1", receivedDateTime="2025-05-01T10:00:00Z",
+                 bodyPreview="Do you still need this phone? Yes")
+    failed = []
+
+    pages = list(email_scanner.iter_two_phase_pages(FakeMailbox(), {(survey, "user1@example.gov"): [newer, older]}, failed))
+
+    # The sender is left alone rather than recorded from the older reply
+    assert pages == []
+    assert failed == [newer]
+
+
+def test_short_preview_is_complete_text(monkeypatch):
+    survey = make_survey("phones", "Phone Survey", "Do you still need this phone?", 0)
+    message = {"id": "AAMk1", "subject": "RE: Phone Survey", "receivedDateTime": "2025-05-01T10:00:00Z",
+               "from": {"emailAddress": {"name": "User 1", "address": "user1@example.gov"}},
+               "bodyPreview": "Do you still need this phone? No"}
+
+    parsed = run_two_phase(monkeypatch, [survey], message, "unused")
+
+    assert [result["answers"] for result in parsed] == [{0: "No"}]